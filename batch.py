@@ -0,0 +1,228 @@
+import argparse
+import json
+import os
+import resource
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from volume_renderer import VolumeRenderer
+from budget import MemoryBudget
+from helper import roi_scaled
+from preview import write_previews
+from volume_cache import VolumeCache
+
+FORMATS = ('stl', 'ply', 'glb', 'stl.gz', 'ply.gz', 'glb.gz')
+
+
+def parse_seed(text):
+    seed = [int(c) for c in text.split(',')]
+    if len(seed) != 3:
+        raise argparse.ArgumentTypeError('seed must be x,y,z, got %r' % text)
+    return seed
+
+
+def parse_roi(text):
+    # x0:x1,y0:y1,z0:z1 in voxels, like seeds; an empty side means the edge of the volume
+    try:
+        roi = [[int(c) if c else None for c in r.split(':')] for r in text.split(',')][::-1]
+    except ValueError:
+        raise argparse.ArgumentTypeError('roi must be x0:x1,y0:y1,z0:z1, got %r' % text)
+    if len(roi) != 3 or any(len(r) != 2 for r in roi):
+        raise argparse.ArgumentTypeError('roi must be x0:x1,y0:y1,z0:z1, got %r' % text)
+    return roi
+
+
+def output_path(output, series, fmt):
+    name = os.path.basename(os.path.abspath(series).rstrip(os.sep))
+    return os.path.join(output, '%s.%s' % (name, fmt))
+
+
+def limit_memory(budget):
+    # RLIMIT_AS caps the address space, so a study that does not fit raises MemoryError instead of swapping
+    if budget:
+        resource.setrlimit(resource.RLIMIT_AS, (budget, budget))
+
+
+def convert(series, path, spec):
+    start = time.perf_counter()
+    cache = None if spec['cache'] is None else VolumeCache(spec['cache'])
+    budget = None if spec['budget'] is None else MemoryBudget(factor=spec['budget'])
+    vr = VolumeRenderer(series, workers=spec['threads'], cache=cache, budget=budget)
+    if spec['previews']:
+        write_previews(output_path(os.path.dirname(path), series, 'previews'), vr.previews())
+    if spec['roi'] is not None:
+        vr.set_roi(tuple(slice(*r) for r in spec['roi']))
+    roi = vr.roi
+    seeds = spec['seeds']
+    if len(seeds) == 1:
+        vr.segmentation(seeds[0], tolerance=spec['tolerance'])
+    elif seeds:
+        vr.segment_seeds([(s, spec['tolerance']) for s in seeds])
+    factor = spec['downsample']
+    if factor > 1:
+        vr.scans = vr.downsampled((factor,) * 3)
+        vr.spacing = vr.spacing * factor
+        if roi is not None:
+            vr.set_roi(roi_scaled(roi, (factor,) * 3))
+    vr.make_mesh(threshold=spec['threshold'], tiled=spec['tiled'], workers=spec['threads'])
+    simplified = None
+    if spec['target_faces'] or spec['max_error'] is not None or spec['smoothing']:
+        simplified = vr.simplify_mesh(spec['target_faces'], spec['max_error'], spec['smoothing'])
+    vr.scale(list(vr.spacing[::-1]))
+    # written under a temporary name so an interrupted run is never taken for a finished one
+    partial = os.path.join(os.path.dirname(path), '.part-' + os.path.basename(path))
+    vr.save(path=partial, bits=spec['bits'])
+    os.replace(partial, path)
+    return {
+        'shape': list(vr.scans.shape),
+        'verts': int(len(vr.verts)),
+        'faces': int(len(vr.faces)),
+        'simplified': simplified,
+        'bytes': os.path.getsize(path),
+        'seconds': time.perf_counter() - start,
+        # the worker runs only this series, so its peak is the series' peak
+        'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+
+def run_one(series, path, spec):
+    try:
+        result = convert(series, path, spec)
+    except MemoryError:
+        return dict(status='out_of_memory')
+    except Exception as e:
+        return dict(status='failed', error='%s: %s' % (type(e).__name__, e))
+    result['status'] = 'done'
+    return result
+
+
+def run_pool(queue, spec, jobs, memory_budget, records):
+    # every series gets a fresh worker, so ru_maxrss is that series' own peak,
+    # and at most jobs series are in flight when a worker dies and takes the pool with it
+    running = {}
+    with ProcessPoolExecutor(jobs, initializer=limit_memory, initargs=(memory_budget,),
+                             max_tasks_per_child=1) as pool:
+        while queue or running:
+            while queue and len(running) < jobs:
+                s, path = queue.pop(0)
+                running[pool.submit(run_one, s, path, spec)] = (s, path)
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    return list(running.values())
+                except Exception as e:
+                    result = dict(status='failed', error='%s: %s' % (type(e).__name__, e))
+                s, path = running.pop(future)
+                record = dict(series=s, output=path, **result)
+                records.append(record)
+                print('%-8s %s' % (record['status'], s))
+    return []
+
+
+def run_batch(series, output, spec, jobs=None, memory_budget=None, force=False):
+    os.makedirs(output, exist_ok=True)
+    jobs = jobs or os.cpu_count()
+    records = []
+    queue = []
+    for s in series:
+        path = output_path(output, s, spec['format'])
+        if not force and os.path.exists(path):
+            records.append({'series': s, 'output': path, 'status': 'skipped'})
+            continue
+        queue.append((s, path))
+    while queue:
+        crashed = run_pool(queue, spec, jobs, memory_budget, records)
+        for s, path in crashed:
+            # the worker died, e.g. killed by the OOM killer: rerun each alone so only the culprit is blamed
+            if len(crashed) == 1 or run_pool([(s, path)], spec, 1, memory_budget, records):
+                records.append({'series': s, 'output': path, 'status': 'crashed',
+                                'error': 'worker process died'})
+                print('%-8s %s' % ('crashed', s))
+    return records
+
+
+def summary(records):
+    done = [r for r in records if r['status'] == 'done']
+    counts = {}
+    for r in records:
+        counts[r['status']] = counts.get(r['status'], 0) + 1
+    return {
+        'series': len(records),
+        'counts': counts,
+        'seconds': float(sum(r['seconds'] for r in done)),
+        'faces': int(sum(r['faces'] for r in done)),
+        'bytes': int(sum(r['bytes'] for r in done)),
+        'max_rss': int(max([r['max_rss'] for r in done] or [0])),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert DICOM series to meshes without the GUI.')
+    parser.add_argument('series', nargs='+', help='series directories')
+    parser.add_argument('-o', '--output', default='models', help='directory for meshes and the report')
+    parser.add_argument('--threshold', type=int, default=300)
+    parser.add_argument('--downsample', type=int, default=1, help='block-average factor before meshing')
+    parser.add_argument('--seed', type=parse_seed, action='append', default=[],
+                        help='x,y,z region-growing seed; may be repeated')
+    parser.add_argument('--roi', type=parse_roi, default=None,
+                        help='x0:x1,y0:y1,z0:z1 voxel box; only this part is segmented and meshed')
+    parser.add_argument('--tolerance', type=int, default=10)
+    parser.add_argument('--format', choices=FORMATS, default='stl')
+    parser.add_argument('--target-faces', type=int, default=None, help='decimate to this many triangles')
+    parser.add_argument('--max-error', type=float, default=None, help='quadric error bound for decimation')
+    parser.add_argument('--smoothing', type=int, default=0, help='Taubin smoothing iterations')
+    parser.add_argument('--bits', type=int, default=None, help='quantize PLY/glTF vertex positions')
+    parser.add_argument('--previews', action='store_true', help='also write slice and MIP thumbnails')
+    parser.add_argument('--tiled', action='store_true', help='mesh in slabs to bound peak memory')
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes')
+    parser.add_argument('--threads', type=int, default=1, help='threads per worker')
+    parser.add_argument('--memory-mb', type=int, default=None, help='address space limit per worker')
+    parser.add_argument('--budget', type=float, default=None,
+                        help='work in place within this multiple of the raw volume size, e.g. 1.2')
+    parser.add_argument('--cache', help='volume cache directory shared by the workers')
+    parser.add_argument('--force', action='store_true', help='redo series whose output already exists')
+    parser.add_argument('--report', help='summary report path, defaults to OUTPUT/report.json')
+    args = parser.parse_args(argv)
+
+    spec = {
+        'threshold': args.threshold,
+        'downsample': args.downsample,
+        'seeds': args.seed,
+        'roi': args.roi,
+        'tolerance': args.tolerance,
+        'format': args.format,
+        'bits': args.bits,
+        'target_faces': args.target_faces,
+        'max_error': args.max_error,
+        'smoothing': args.smoothing,
+        'tiled': args.tiled,
+        'previews': args.previews,
+        'threads': args.threads,
+        'cache': args.cache,
+        'budget': args.budget,
+    }
+    budget = None if args.memory_mb is None else args.memory_mb << 20
+    start = time.perf_counter()
+    records = run_batch(args.series, args.output, spec, args.jobs, budget, args.force)
+    report = {
+        'run': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'spec': spec,
+        'memory_budget': budget,
+        'wall_seconds': time.perf_counter() - start,
+        'summary': summary(records),
+        'series': records,
+    }
+    path = args.report or os.path.join(args.output, 'report.json')
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    s = report['summary']
+    print('%d series: %s, %.1fs, %d faces, report in %s' % (s['series'], s['counts'], report['wall_seconds'],
+                                                           s['faces'], path))
+    return 0 if all(r['status'] in ('done', 'skipped') for r in records) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
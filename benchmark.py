@@ -0,0 +1,197 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pydicom as dicom
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import CTImageStorage, ExplicitVRLittleEndian, RLELossless, generate_uid
+
+from volume_renderer import DEFAULT_SMOOTHING, VolumeRenderer
+from helper import blockwise_average_3D, scale_matrix, transform
+from segmentator import Segmentator
+import instrumentation
+from smoothing import smooth
+
+PHANTOMS = ('spheres', 'tubes', 'both')
+COMPRESSIONS = ('none', 'rle')
+
+
+def phantom_volume(slices, size, phantom='both'):
+    z, y, x = np.ogrid[:slices, :size, :size]
+    c = size / 2.0
+    volume = np.full((slices, size, size), -1000, dtype=np.int16)
+    body = (y - c) ** 2 + (x - c) ** 2 < (0.45 * size) ** 2
+    volume[np.broadcast_to(body, volume.shape)] = 40
+    if phantom in ('spheres', 'both'):
+        r = 0.12 * size
+        for cz, cy, cx in ((0.5, 0.5, 0.5), (0.3, 0.35, 0.65), (0.7, 0.65, 0.35)):
+            sphere = (z - cz * slices) ** 2 + (y - cy * size) ** 2 + (x - cx * size) ** 2 < r ** 2
+            volume[sphere] = 700
+    if phantom in ('tubes', 'both'):
+        for cy, cx, hu in ((0.5, 0.25, 300), (0.5, 0.75, 300), (0.25, 0.5, -800)):
+            tube = (y - cy * size) ** 2 + (x - cx * size) ** 2 < (0.05 * size) ** 2
+            volume[np.broadcast_to(tube, volume.shape) & (volume != 700)] = hu
+    return volume
+
+
+def synthetic_series(directory, slices=128, size=256, compression='none', phantom='both',
+                     spacing=(1.25, 0.7, 0.7), intercept=-1024):
+    if compression not in COMPRESSIONS:
+        raise ValueError('unknown compression %r, expected one of %s' % (compression, COMPRESSIONS))
+    os.makedirs(directory, exist_ok=True)
+    volume = phantom_volume(slices, size, phantom)
+    series = generate_uid()
+    for i in range(slices):
+        meta = FileMetaDataset()
+        meta.MediaStorageSOPClassUID = CTImageStorage
+        meta.MediaStorageSOPInstanceUID = generate_uid()
+        meta.TransferSyntaxUID = ExplicitVRLittleEndian
+        ds = Dataset()
+        ds.file_meta = meta
+        ds.SOPClassUID = CTImageStorage
+        ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+        ds.SeriesInstanceUID = series
+        ds.Modality = 'CT'
+        ds.Rows = ds.Columns = size
+        ds.SamplesPerPixel = 1
+        ds.PhotometricInterpretation = 'MONOCHROME2'
+        ds.BitsAllocated = 16
+        ds.BitsStored = 12
+        ds.HighBit = 11
+        ds.PixelRepresentation = 0
+        ds.InstanceNumber = i + 1
+        ds.ImagePositionPatient = [0.0, 0.0, i * spacing[0]]
+        ds.SliceLocation = i * spacing[0]
+        ds.PixelSpacing = [spacing[1], spacing[2]]
+        ds.SliceThickness = spacing[0]
+        ds.RescaleIntercept = intercept
+        ds.RescaleSlope = 1
+        ds.PixelData = (volume[i].astype(np.int32) - intercept).astype(np.uint16).tobytes()
+        if compression == 'rle':
+            ds.compress(RLELossless)
+        ds.save_as(os.path.join(directory, 'IM%05d' % i), enforce_file_format=True)
+    return volume
+
+
+class Recorder:
+    def __init__(self, run, trace=True):
+        self.run = run
+        self.trace = trace
+        self.records = []
+
+    def measure(self, stage, fn, **fields):
+        gc.collect()
+        if self.trace:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        result = fn()
+        seconds = time.perf_counter() - start
+        record = dict(self.run, stage=stage, seconds=seconds,
+                      max_rss=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, **fields)
+        if self.trace:
+            record['peak_bytes'] = tracemalloc.get_traced_memory()[1] - base
+        self.records.append(record)
+        print('%-22s %8.3fs  %s' % (stage, seconds, '' if not self.trace else '%.1f MB' % (record['peak_bytes'] / 2 ** 20)))
+        return result
+
+
+def run_pipeline(series, recorder, threshold=300, workers=None, output=None):
+    vr = recorder.measure('VolumeRenderer', lambda: VolumeRenderer(series, workers=workers))
+    slices = recorder.measure('load_scans', lambda: vr.load_scans(series)[::-1])
+    volume = recorder.measure('get_pixels_hu', lambda: vr.get_pixels_hu(slices))
+    recorder.measure('smoothing', lambda: smooth(volume, workers=workers, **DEFAULT_SMOOTHING))
+    segmentator = recorder.measure('Segmentator', lambda: Segmentator(volume))
+    seed = [volume.shape[2] // 2, volume.shape[1] // 2, volume.shape[0] // 2]
+    mask = recorder.measure('regionGrow', lambda: segmentator.regionGrow(seed))
+    recorder.measure('blockwise_average_3D', lambda: blockwise_average_3D(volume, (2, 2, 2)))
+    recorder.measure('make_mesh', lambda: vr.make_mesh(threshold=threshold))
+    recorder.measure('make_mesh_tiled', lambda: vr.make_mesh(threshold=threshold, tiled=True))
+    recorder.measure('transform', lambda: transform(vr.verts, scale_matrix(vr.spacing[::-1])),
+                     verts=len(vr.verts))
+    recorder.measure('scale', lambda: vr.scale(list(vr.spacing[::-1])))
+    path = os.path.join(output, 'benchmark.stl')
+    recorder.measure('save', lambda: vr.save(path=path), faces=len(vr.faces))
+    recorder.records[-1]['bytes'] = os.path.getsize(path)
+    return mask
+
+
+def load_baseline(path):
+    # the last run in the file wins
+    baseline = {}
+    with open(path) as f:
+        for line in f:
+            r = json.loads(line)
+            baseline[r['stage']] = r
+    return baseline
+
+
+def compare(records, baseline):
+    for r in records:
+        b = baseline.get(r['stage'])
+        if b is not None and b['seconds'] > 0:
+            print('%-22s %8.3fs -> %8.3fs  x%.2f' % (r['stage'], b['seconds'], r['seconds'], r['seconds'] / b['seconds']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the MEDAR pipeline on a synthetic CT series.')
+    parser.add_argument('--slices', type=int, default=128)
+    parser.add_argument('--size', type=int, default=256)
+    parser.add_argument('--compression', choices=COMPRESSIONS, default='none')
+    parser.add_argument('--phantom', choices=PHANTOMS, default='both')
+    parser.add_argument('--threshold', type=int, default=300)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--series', help='existing series directory to reuse instead of generating one')
+    parser.add_argument('--output', default='bench_output.jsonl', help='JSON lines file, appended to')
+    parser.add_argument('--compare', help='earlier JSON lines output to compare against')
+    parser.add_argument('--no-trace', action='store_true', help='skip tracemalloc peak tracking')
+    parser.add_argument('--events', help='JSON lines file for per-stage instrumentation events')
+    args = parser.parse_args(argv)
+    if args.events:
+        instrumentation.log_to(args.events)
+
+    workdir = tempfile.mkdtemp(prefix='medar-bench-')
+    try:
+        series = args.series
+        if series is None:
+            series = os.path.join(workdir, 'series')
+            print('generating %d x %d x %d %s series' % (args.slices, args.size, args.size, args.compression))
+            synthetic_series(series, args.slices, args.size, args.compression, args.phantom)
+        run = {
+            'run': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'host': platform.node(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pydicom': dicom.__version__,
+            'slices': args.slices,
+            'size': args.size,
+            'compression': args.compression,
+            'phantom': args.phantom,
+            'workers': args.workers,
+        }
+        baseline = load_baseline(args.compare) if args.compare else None
+        recorder = Recorder(run, trace=not args.no_trace)
+        if recorder.trace:
+            tracemalloc.start()
+        run_pipeline(series, recorder, args.threshold, args.workers, workdir)
+        if recorder.trace:
+            tracemalloc.stop()
+        with open(args.output, 'a') as f:
+            for record in recorder.records:
+                f.write(json.dumps(record) + '\n')
+        if baseline is not None:
+            compare(recorder.records, baseline)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import instrumentation
+
+
+class MemoryBudget:
+    def __init__(self, limit=None, factor=1.2):
+        # limit is absolute bytes, factor is relative to the raw volume; the tighter one wins
+        self.limit = limit
+        self.factor = factor
+
+    def total(self, volume_bytes):
+        limits = [l for l in (self.limit, None if self.factor is None else self.factor * volume_bytes) if l]
+        return int(min(limits)) if limits else None
+
+    def slab(self, volume, bytes_per_voxel, resident=None, workers=1, minimum=1):
+        plane = volume.shape[1] * volume.shape[2]
+        resident = volume.nbytes if resident is None else resident
+        total = self.total(volume.nbytes)
+        if total is None:
+            return volume.shape[0]
+        n = int((total - resident) // (bytes_per_voxel * plane * max(1, workers)))
+        if n < minimum:
+            instrumentation.emit('budget', exceeded=True, total=total, resident=resident,
+                                 needed=minimum * bytes_per_voxel * plane * max(1, workers))
+            n = minimum
+        return min(n, volume.shape[0])
@@ -0,0 +1,47 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import scipy.ndimage as ndi
+import SimpleITK as sitk
+
+DEFAULT_BANDS = ((-1000, -400), (-100, 300), (300, 3000))
+
+
+class ComponentIndex:
+    def __init__(self, image, bands=DEFAULT_BANDS, workers=None):
+        self.bands = [tuple(b) for b in bands]
+        with ThreadPoolExecutor(workers) as pool:
+            parts = list(pool.map(lambda band: self.label(image, band), self.bands))
+        self.labels = [p[0] for p in parts]
+        self.boxes = [p[1] for p in parts]
+        self.counts = [p[2] for p in parts]
+
+    def label(self, image, band):
+        lower, upper = band
+        binary = sitk.BinaryThreshold(image, lower, upper, 1, 0)
+        labels = sitk.GetArrayFromImage(sitk.ConnectedComponent(binary, False))
+        n = int(labels.max())
+        labels = labels.astype(np.uint8 if n < 256 else np.uint16 if n < 65536 else np.uint32)
+        return labels, ndi.find_objects(labels), np.bincount(labels.ravel(), minlength=n + 1)
+
+    @property
+    def nbytes(self):
+        return sum(l.nbytes for l in self.labels)
+
+    def band(self, value):
+        for i, (lower, upper) in enumerate(self.bands):
+            if lower <= value <= upper:
+                return i
+        return None
+
+    def query(self, seed, value, pad=0):
+        b = self.band(value)
+        if b is None:
+            return None
+        labels = self.labels[b]
+        label = labels[tuple(seed[::-1])]
+        if label == 0:
+            return None
+        box = tuple(slice(max(0, s.start - pad), min(n, s.stop + pad))
+                    for s, n in zip(self.boxes[b][label - 1], labels.shape))
+        return box, labels[box] == label
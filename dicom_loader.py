@@ -0,0 +1,111 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pydicom as dicom
+
+from tasks import report
+
+
+def list_series(scans_dir):
+    files = [os.path.join(scans_dir, f) for f in sorted(os.listdir(scans_dir))]
+    return [f for f in files if os.path.isfile(f)]
+
+
+def read_header(path):
+    return dicom.dcmread(path, stop_before_pixels=True)
+
+
+def run_pool(fn, items, workers=None, progress=None, stage=''):
+    pool = ThreadPoolExecutor(workers)
+    results = []
+    try:
+        for result in pool.map(fn, items):
+            results.append(result)
+            report(progress, len(results) / len(items), stage)
+    finally:
+        pool.shutdown(cancel_futures=True)
+    return results
+
+
+def read_headers(scans_dir, workers=None, progress=None):
+    files = list_series(scans_dir)
+    slices = run_pool(read_header, files, workers, progress, 'headers')
+    return sort_slices(slices)
+
+
+def slice_position(s):
+    try:
+        return float(s.ImagePositionPatient[2])
+    except (AttributeError, IndexError, TypeError):
+        return float(getattr(s, 'SliceLocation', 0))
+
+
+def sort_slices(slices):
+    if all('InstanceNumber' in s for s in slices):
+        slices.sort(key=lambda x: (int(x.InstanceNumber), slice_position(x)))
+    else:
+        slices.sort(key=slice_position)
+    return slices
+
+
+def rescale(s):
+    slope = float(getattr(s, 'RescaleSlope', 1))
+    intercept = float(getattr(s, 'RescaleIntercept', -1000))
+    return slope, intercept
+
+
+def decode_slice(s, out):
+    pixels = dicom.dcmread(s.filename).pixel_array
+    slope, intercept = rescale(s)
+    if slope == 1 and intercept == int(intercept):
+        hu = np.add(pixels, np.int32(intercept), dtype=np.int32)
+        np.clip(hu, -32768, 32767, out=hu)
+        out[...] = hu
+    else:
+        hu = pixels.astype(np.float32)
+        hu *= np.float32(slope)
+        hu += np.float32(intercept)
+        np.rint(hu, out=hu)
+        np.clip(hu, -32768, 32767, out=hu)
+        out[...] = hu
+
+
+def read_volume(slices, workers=None, out=None, progress=None):
+    first = slices[0]
+    shape = (len(slices), int(first.Rows), int(first.Columns))
+    volume = np.empty(shape, dtype=np.int16) if out is None else out
+    run_pool(lambda i: decode_slice(slices[i], volume[i]), range(len(slices)), workers, progress, 'decode')
+    return volume
+
+
+def refinement_order(step):
+    # halving the gaps first: for a step of 8 the passes fill offsets 4, 2, 6, 1, 3, 5, 7
+    return sorted(range(1, step), key=lambda o: (-((o & -o).bit_length()), o))
+
+
+def fill_gaps(volume, decoded):
+    # slices not decoded yet repeat the nearest decoded slice before them
+    decoded = np.sort(np.asarray(decoded))
+    index = np.arange(len(volume))
+    source = decoded[np.maximum(np.searchsorted(decoded, index, side='right') - 1, 0)]
+    for z in np.flatnonzero(source != index):
+        volume[z] = volume[source[z]]
+
+
+def read_volume_progressive(slices, step=8, workers=None, out=None, progress=None, refined=None):
+    first = slices[0]
+    shape = (len(slices), int(first.Rows), int(first.Columns))
+    volume = np.empty(shape, dtype=np.int16) if out is None else out
+    decoded = []
+    passes = [0] + [o for o in refinement_order(step) if o < len(slices)]
+    for n, offset in enumerate(passes):
+        batch = list(range(offset, len(slices), step))
+        part = None if progress is None else lambda f, stage: progress((n + f) / len(passes), stage)
+        run_pool(lambda i: decode_slice(slices[i], volume[i]), batch, workers, part, 'decode')
+        decoded.extend(batch)
+        if len(decoded) < len(slices):
+            fill_gaps(volume, decoded)
+        if refined is not None:
+            refined(volume, len(decoded) / len(slices))
+    return volume
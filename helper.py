@@ -1,7 +1,34 @@
+import functools
+
 import numpy as np
 from math import cos, sin
 import matplotlib.pyplot as plt
 
+# volumes are stored as int16 HU; float32 only where averaging or filtering needs fractions
+VOLUME_DTYPE = np.dtype(np.int16)
+WORK_DTYPE = np.dtype(np.float32)
+VOLUME_DTYPES = (VOLUME_DTYPE, WORK_DTYPE)
+
+
+def check_dtype(volume, accepts=VOLUME_DTYPES, stage='volume'):
+    if volume.dtype not in accepts:
+        raise TypeError('%s accepts %s volumes, got %s' % (stage, '/'.join(str(d) for d in accepts), volume.dtype))
+    return volume
+
+
+def accepts(*dtypes, arg=0):
+    dtypes = tuple(np.dtype(d) for d in dtypes) or VOLUME_DTYPES
+
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            check_dtype(args[arg], dtypes, fn.__qualname__)
+            return fn(*args, **kwargs)
+        inner.accepts = dtypes
+        return inner
+    return wrap
+
+
 def rotation_matrix(v, alpha):
     v = np.array(v)
     v = v / np.linalg.norm(v)
@@ -37,18 +64,71 @@ def scale_matrix(s, origin=[0, 0, 0]):
 
 
 def transform(verts, matrix):
-    new_verts = []
-    matrix = np.array(matrix)
-    for v in verts:
-        v = np.append(v, np.array([1]))
-        nv = matrix.dot(np.array(v).T)[:-1].tolist()
-        new_verts.append(nv)
-    return np.array(new_verts)
-
-
-def blockwise_average_3D(A, S):
-    m, n, r = np.array(A.shape) // S
-    return A.reshape(m, S[0], n, S[1], r, S[2]).mean((1, 3, 5))
+    matrix = np.asarray(matrix)
+    verts = np.asarray(verts)
+    return verts.dot(matrix[:3, :3].T) + matrix[:3, 3]
+
+
+def transform_normals(normals, matrix):
+    # normals follow the inverse transpose, so non-uniform scaling keeps them perpendicular
+    normals = np.asarray(normals).dot(np.linalg.inv(np.asarray(matrix, dtype=np.float64)[:3, :3]))
+    length = np.linalg.norm(normals, axis=1, keepdims=True)
+    np.divide(normals, length, out=normals, where=length > 0)
+    return normals
+
+
+def roi_slices(bounds, spacing, shape, origin=(0, 0, 0)):
+    # VTK (xmin, xmax, ymin, ymax, zmin, zmax) world bounds to (z, y, x) voxel slices, rounded outwards
+    roi = []
+    for axis in range(3):
+        lo = (bounds[2 * axis] - origin[axis]) / spacing[axis]
+        hi = (bounds[2 * axis + 1] - origin[axis]) / spacing[axis]
+        start = max(0, int(np.floor(lo + 1e-6)))
+        stop = min(shape[2 - axis], int(np.ceil(hi - 1e-6)) + 1)
+        roi.append(slice(start, max(start, stop)))
+    return tuple(roi[::-1])
+
+
+def roi_scaled(roi, S):
+    # the same region on a volume block-averaged by S, covering every block it touches
+    return tuple(slice(r.start // s, -(-r.stop // s)) for r, s in zip(roi, S))
+
+
+@accepts()
+def blockwise_average_3D(A, S, slab=None):
+    if tuple(S) == (1, 1, 1):
+        return A
+    if slab is not None and slab < A.shape[0]:
+        # whole blocks of slices at a time keep the float32 temporaries slab-sized
+        step = max(1, slab // S[0]) * S[0]
+        result = np.empty([-(-n // s) for n, s in zip(A.shape, S)], dtype=A.dtype)
+        for start in range(0, A.shape[0], step):
+            result[start // S[0]:(start + step) // S[0]] = blockwise_average_3D(A[start:start + step], S)
+        return result
+    out = A
+    for axis, s in enumerate(S):
+        if s == 1:
+            continue
+        # reduceat keeps the partial block at the edge of non-divisible axes
+        idx = np.arange(0, out.shape[axis], s)
+        counts = np.diff(np.append(idx, out.shape[axis])).astype(np.float32)
+        out = np.add.reduceat(out, idx, axis=axis, dtype=np.float32)
+        shape = [1, 1, 1]
+        shape[axis] = -1
+        out /= counts.reshape(shape)
+    if np.issubdtype(A.dtype, np.integer):
+        np.rint(out, out=out)
+    return out.astype(A.dtype, copy=False)
+
+
+@accepts()
+def build_pyramid(A, levels=(2, 4, 8), slab=None):
+    pyramid = {1: A}
+    previous = 1
+    for level in levels:
+        pyramid[level] = blockwise_average_3D(pyramid[previous], (level // previous,) * 3, slab)
+        previous = level
+    return pyramid
 
 
 def view_sample(model):
@@ -0,0 +1,86 @@
+import numpy as np
+
+HU_MIN, HU_MAX = -1024, 3071
+
+
+def slice_histogram(s, lo=HU_MIN, hi=HU_MAX):
+    index = np.clip(s, lo, hi).astype(np.int32)
+    index -= lo
+    return np.bincount(index.ravel(), minlength=hi - lo + 1)
+
+
+class HUStatistics:
+    def __init__(self, histograms, lo=HU_MIN):
+        self.histograms = histograms
+        self.lo = lo
+        self.hi = lo + histograms.shape[1] - 1
+        self.total = histograms.sum(axis=0)
+        self.values = np.arange(self.lo, self.hi + 1)
+
+    @classmethod
+    def from_volume(cls, volume, lo=HU_MIN, hi=HU_MAX):
+        histograms = np.empty((volume.shape[0], hi - lo + 1), dtype=np.int32)
+        for z in range(volume.shape[0]):
+            histograms[z] = slice_histogram(volume[z], lo, hi)
+        return cls(histograms, lo)
+
+    def updated(self, volume, slices):
+        histograms = self.histograms.copy()
+        for z in slices:
+            histograms[z] = slice_histogram(volume[z], self.lo, self.hi)
+        return HUStatistics(histograms, self.lo)
+
+    def histogram(self, z=None, floor=None):
+        counts = self.total if z is None else self.histograms[z]
+        if floor is not None:
+            counts = np.where(self.values >= floor, counts, 0)
+        return counts
+
+    def percentile(self, q, z=None, floor=None):
+        cdf = np.cumsum(self.histogram(z, floor))
+        if cdf[-1] == 0:
+            return None
+        index = np.searchsorted(cdf, np.maximum(np.asarray(q) / 100.0 * cdf[-1], 1))
+        return self.values[np.minimum(index, len(self.values) - 1)]
+
+    def summary(self, z=None, floor=None):
+        counts = self.histogram(z, floor)
+        n = counts.sum()
+        if n == 0:
+            return {'count': 0}
+        present = np.flatnonzero(counts)
+        mean = float(np.dot(counts, self.values) / n)
+        std = float(np.sqrt(np.dot(counts, (self.values - mean) ** 2) / n))
+        p = self.percentile([1, 5, 25, 50, 75, 95, 99], z, floor)
+        return {
+            'count': int(n),
+            'min': int(self.values[present[0]]),
+            'max': int(self.values[present[-1]]),
+            'mean': mean,
+            'std': std,
+            'p1': int(p[0]), 'p5': int(p[1]), 'p25': int(p[2]), 'p50': int(p[3]),
+            'p75': int(p[4]), 'p95': int(p[5]), 'p99': int(p[6]),
+        }
+
+    def suggest_window(self, low=5, high=99.5, floor=-990):
+        # the -1000 fill of masked voxels and air would otherwise dominate the window
+        p = self.percentile([low, high], floor=floor)
+        if p is None:
+            return self.lo, self.hi
+        return int(p[0]), int(p[1])
+
+    def suggest_threshold(self, floor=-990):
+        counts = self.histogram(floor=floor).astype(np.float64)
+        if counts.sum() == 0:
+            return 0
+        # Otsu: maximise the between-class variance over every split of the histogram
+        weight = np.cumsum(counts)
+        mass = np.cumsum(counts * self.values)
+        total_weight, total_mass = weight[-1], mass[-1]
+        background = weight[:-1]
+        foreground = total_weight - background
+        valid = (background > 0) & (foreground > 0)
+        mean_b = np.divide(mass[:-1], background, out=np.zeros_like(background), where=valid)
+        mean_f = np.divide(total_mass - mass[:-1], foreground, out=np.zeros_like(foreground), where=valid)
+        variance = np.where(valid, background * foreground * (mean_b - mean_f) ** 2, 0)
+        return int(self.values[np.argmax(variance)])
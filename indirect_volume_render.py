@@ -2,20 +2,56 @@ import sys
 
 from PyQt5 import Qt
 from PyQt5.QtGui import QIntValidator
-from PyQt5.QtWidgets import QFileDialog, QAction, QLabel, QSlider, QPushButton, QLineEdit
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from PyQt5.QtWidgets import QFileDialog, QAction, QLabel, QSlider, QPushButton, QLineEdit, QProgressBar
 from qtpy import QtCore
 from vtk.qt.QVTKRenderWindowInteractor import QVTKRenderWindowInteractor
 
 from volume_renderer import *
+import instrumentation
+from surface_cache import SurfaceCache
+from scene import Scene, import_volume
+from tasks import Cancelled, Task
+from volume_cache import VolumeCache, default_cache_bytes
+from vtk_bridge import VolumeImport
+
+
+class WorkerSignals(QObject):
+    progress = pyqtSignal(float, str)
+    partial = pyqtSignal(object)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(object)
+
+
+class Worker(QRunnable):
+    def __init__(self, fn):
+        QRunnable.__init__(self)
+        self.fn = fn
+        self.signals = WorkerSignals()
+        self.task = Task(self.signals.progress.emit, self.signals.partial.emit)
+
+    def run(self):
+        try:
+            result = self.fn(self.task)
+        except Exception as e:
+            self.signals.failed.emit(e)
+        else:
+            self.signals.finished.emit(result)
 
 
 class MainWindow(Qt.QMainWindow):
 
-    def readData(self, folder):
+    def readData(self, folder, vr=None):
 
         self.folder = folder
-        self.vr = VolumeRenderer(folder)
-        self.scale = list(self.vr.raw_scans[0].PixelSpacing) + [self.vr.raw_scans[0].SliceThickness]
+        self.vr = VolumeRenderer(folder, cache=self.cache) if vr is None else vr
+
+    @property
+    def scale(self):
+        # read through so resampling the renderer keeps the scene geometry right;
+        # while a study streams in there is no renderer yet, only its spacing
+        spacing = self.vr.spacing if self.streaming is None else self.streaming
+        return list(spacing[::-1])
 
     def preprocess(self, newScale, extract, mask, seed=None):
         if mask is not None:
@@ -28,38 +64,61 @@ class MainWindow(Qt.QMainWindow):
         if seed is not None:
             self.vr.segmentation(seed)
 
-        if newScale is not None:
-            self.scans = blockwise_average_3D(self.vr.scans, newScale)
-        else:
-            self.scans = blockwise_average_3D(self.vr.scans, (1, 1, 1))
-
-
+        if newScale is None:
+            newScale = (1, 1, 1)
+        self.scans, self.scansStart = self.cropped(self.vr.downsampled(newScale), newScale)
+        roi = None if self.vr.roi is None else tuple((r.start, r.stop) for r in self.vr.roi)
+        self.scansKey = (self.vr.layers.version, tuple(newScale), roi)
+        self.coarseFactor = None
+        voxels = np.prod(self.scans.shape)
+        if tuple(newScale) == (1, 1, 1) and voxels > self.lodVoxels:
+            levels = sorted(self.vr.pyramid)[1:]
+            self.coarseFactor = next((l for l in levels if voxels / l ** 3 <= self.lodVoxels), levels[-1])
+        self.coarseScans, self.coarseStart = None, (0, 0, 0)
+        if self.coarseFactor is not None:
+            factor = (self.coarseFactor,) * 3
+            self.coarseScans, self.coarseStart = self.cropped(self.vr.downsampled(factor), factor)
+
+    def cropped(self, volume, factor):
+        # the renderer's region of interest and the (x, y, z) index it starts at; a box cropped in y/x
+        # is not contiguous, so copy it once here and let every import share that buffer
+        if self.vr.roi is None:
+            return volume, (0, 0, 0)
+        roi = roi_scaled(self.vr.roi, factor)
+        return np.ascontiguousarray(volume[roi]), tuple(r.start for r in roi[::-1])
+
+    @instrumentation.traced()
     def directVolumeRenader(self, newScale=(1,1,1), extract=None, mask=None, seed=None):
         self.preprocess(newScale, extract, mask, seed)
         self.shape = self.scans.shape
         if self.l7 is not None:
-            self.l7.setText("Зерно (x,y,z) [0-%d][0-%d][0-%d]" % self.shape[::-1])
-        print('directVolumeRenader')
+            # seeds are typed in whole-volume voxels, inside the region of interest if there is one
+            ranges = tuple(v for a, n in zip(self.scansStart, self.shape[::-1]) for v in (a, a + n))
+            self.l7.setText("Зерно (x,y,z) [%d-%d][%d-%d][%d-%d]" % ranges)
+        instrumentation.emit('scans', scans=self.scans, coarse=self.coarseScans, factor=self.coarseFactor)
+
+    @instrumentation.traced()
+    def exportMesh(self, path, threshold, progress=None):
+        self.vr.make_mesh(threshold=threshold, tiled=True, progress=progress)
+        self.vr.scale(self.scale)
+        return self.vr.save(path=path, progress=progress)
 
     def indirectVolumeRenader(self, threshold=-300, newScale=(2,2,2), extract=None, mask=None):
         self.preprocess(newScale, extract, mask)
         self.vr.make_mesh(threshold=threshold)
         self.vr.scale(self.scale)
-        self.vr.save('model')
-        print('saved')
-        return 'data/model.stl'
+        return self.vr.save('model')
 
-    def initReader(self):
-        [h, w, z] = self.scans.shape
+    def importScans(self, volumeImport, scans, scale, factor=1, start=(0, 0, 0)):
+        # imported zero-copy, so whatever dtype the volume has is what VTK renders from
+        check_dtype(scans, stage='MainWindow.importScans')
+        import_volume(volumeImport, scans, scale, factor, start)
 
-        data_string = self.scans.tostring()
-        self.reader.CopyImportVoidPointer(data_string, len(data_string))
-        self.reader.SetDataScalarTypeToDouble()
-        self.reader.SetNumberOfScalarComponents(1)
-        self.reader.SetDataExtent(0, z - 1, 0, w - 1, 0, h - 1)
-        self.reader.SetWholeExtent(0, z - 1, 0, w - 1, 0, h - 1)
-        sx, sy, sz = self.scale
-        self.reader.SetDataSpacing(sx, sy, sz)
+    def initReader(self):
+        self.importScans(self.volumeImport, self.scans, self.scale, 1, self.scansStart)
+        if self.coarseScans is not None:
+            self.importScans(self.coarseImport, self.coarseScans, self.scale, self.coarseFactor, self.coarseStart)
+        self.interactive = False
 
         self.planes = vtk.vtkPlanes()
         def ClipVolumeRender(obj, event):
@@ -83,123 +142,149 @@ class MainWindow(Qt.QMainWindow):
         selectedOutlineProperty.SetLineWidth(3)
 
 
+    def initIndirectPipeline(self):
+        self.surfaceImport = self.scene.surface_import
+        self.contour = self.scene.contour
+        self.skinNormals = self.scene.normals
+        self.skinMapper = self.scene.skin_mapper
+        self.skin = self.scene.skin
+        self.skinOutline = self.scene.skin_outline
+
+    def surface(self, thresh, progress=None):
+        key = (self.scansKey, thresh)
+        surface = self.surfaceCache.get(key)
+        if surface is None:
+            with instrumentation.stage('MainWindow.surface', threshold=thresh, scans=self.scans) as fields:
+                surface = self.contourSurface(thresh, progress)
+                fields['cells'] = surface.GetNumberOfCells()
+                fields['bytes'] = surface.GetActualMemorySize() * 1024
+            self.surfaceCache.put(key, surface)
+        return surface
+
+    def contourSurface(self, thresh, progress=None):
+        # the contour has its own import of the same buffer so it can run off the GUI thread
+        self.importScans(self.surfaceImport, self.scans, self.scale, 1, self.scansStart)
+        return self.scene.surface(thresh, progress)
+
     def resetIndirectModel(self, thresh):
-        self.ren.Clear()
-        self.ren.RemoveAllViewProps()
+        self.showSurface(self.surface(thresh))
 
-        volumeMapper = vtk.vtkContourFilter()
+    @instrumentation.traced()
+    def showSurface(self, surface):
         self.initReader()
-        volumeMapper.SetInputConnection(self.reader.GetOutputPort())
-        volumeMapper.SetValue(0, thresh)
-        skinNormals = vtk.vtkPolyDataNormals()
-        skinNormals.SetInputConnection(volumeMapper.GetOutputPort())
-        skinNormals.SetFeatureAngle(60.0)
-        skinMapper = vtk.vtkPolyDataMapper()
-        skinMapper.SetInputConnection(skinNormals.GetOutputPort())
-        skinMapper.ScalarVisibilityOff()
-        skin = vtk.vtkActor()
-        skin.SetMapper(skinMapper)
-
-        # An outline provides context around the data.
-        outlineData = vtk.vtkOutlineFilter()
-        outlineData.SetInputConnection(self.reader.GetOutputPort())
-        mapOutline = vtk.vtkPolyDataMapper()
-        mapOutline.SetInputConnection(outlineData.GetOutputPort())
-        outline = vtk.vtkActor()
-        outline.SetMapper(mapOutline)
-        outline.GetProperty().SetColor(0, 0, 0)
-
-        camera = vtk.vtkCamera()
-        camera.SetViewUp(0, 0, 1)
-        camera.SetPosition(0, -1, 0)
-        camera.SetFocalPoint(0, 0, 0)
-        camera.ComputeViewPlaneNormal()
-
-        self.ren.AddActor(outline)
-        self.ren.AddActor(skin)
-
-        self.ren.SetActiveCamera(camera)
-        self.ren.ResetCamera()
-        camera.Dolly(1.5)
-
-        self.ren.SetBackground(0.2, 0.2, 0.2)
-        self.ren.ResetCameraClippingRange()
-
+        self.scene.show_surface(surface)
         self.ren.Render()
         self.vtkWidget.update()
 
+    @instrumentation.traced()
     def resetDirectModel(self):
-        self.ren.Clear()
-        self.ren.RemoveAllViewProps()
-
-
-        self.volumeMapper = vtk.vtkGPUVolumeRayCastMapper()
         self.initReader()
-        self.volumeMapper.SetInputConnection(self.reader.GetOutputPort())
-        self.volumeMapper.SetBlendModeToComposite()
-
-        self.volumeColor = vtk.vtkColorTransferFunction()
-        self.volumeColor.AddRGBPoint(-1000, 0.00, 0.00, 0.00)
-        self.volumeColor.AddRGBPoint(-600, 0.76, 0.41, 0.32)
-        self.volumeColor.AddRGBPoint(-400, 0.76, 0.41, 0.32)
-        self.volumeColor.AddRGBPoint(-100, 0.76, 0.65, 0.45)
-        self.volumeColor.AddRGBPoint(-60, 0.76, 0.65, 0.45)
-        self.volumeColor.AddRGBPoint(40, 0.40, 0.00, 0.00)
-        self.volumeColor.AddRGBPoint(80, 0.60, 0.00, 0.00)
-        self.volumeColor.AddRGBPoint(400, 1.00, 1.00, 0.90)
-        self.volumeColor.AddRGBPoint(1000, 1.00, 1.00, 0.90)
-
-        self.volumeGradientOpacity = vtk.vtkPiecewiseFunction()
-        self.volumeGradientOpacity.AddPoint(0, 0.0)
-        self.volumeGradientOpacity.AddPoint(90, 0.5)
-        self.volumeGradientOpacity.AddPoint(100, 1.0)
-
-
-        self.volumeProperty.SetColor(self.volumeColor)
-        self.volumeProperty.SetScalarOpacity(self.volumeScalarOpacity)
-        self.volumeProperty.SetGradientOpacity(self.volumeGradientOpacity)
-        self.volumeProperty.SetInterpolationTypeToLinear()
-        self.volumeProperty.ShadeOn()
-        self.volumeProperty.SetAmbient(self.ambient)
-        self.volumeProperty.SetDiffuse(self.diffuse)
-        self.volumeProperty.SetSpecular(self.specular)
-
-        self.volume = vtk.vtkVolume()
-        self.volume.SetMapper(self.volumeMapper)
-        self.volume.SetProperty(self.volumeProperty)
-
-        camera = self.ren.GetActiveCamera()
-        c = self.volume.GetCenter()
-        camera.SetFocalPoint(c[0], c[1], c[2])
-        camera.SetPosition(c[0] + 3000, c[1], c[2])
-        camera.SetViewUp(0, 0, 1)
-
-        outline = vtk.vtkOutlineFilter()
-        outline.SetInputConnection(self.reader.GetOutputPort())
-        outlineMapper = vtk.vtkPolyDataMapper()
-        outlineMapper.SetInputConnection(outline.GetOutputPort())
-        outlineActor = vtk.vtkActor()
-        outlineActor.SetMapper(outlineMapper)
-
-
-
-        self.ren.AddViewProp(self.volume)
-        self.ren.AddActor(outlineActor)
-        self.ren.AddVolume(self.volume)
-        self.ren.SetBackground(0.5, 0.5, 0.5)
+        self.volumeMapper = self.scene.show_direct()
         self.ren.Render()
         self.vtkWidget.update()
 
     def initModel(self):
-        try:
-            print('read')
-            self.readData(str(QFileDialog.getExistingDirectory(self, "Select Directory")))
-        except:
+        folder = str(QFileDialog.getExistingDirectory(self, "Select Directory"))
+        if folder == "":
             return
-        print('init')
+        instrumentation.emit('study', folder=folder)
+        self.runTask(lambda task: VolumeRenderer(folder, cache=self.cache, progress=task,
+                                                 refined=lambda *update: task.publish(update),
+                                                 step=self.streamStep),
+                     lambda vr: self.showStudy(folder, vr), self.showPartial)
+
+    def showPartial(self, update):
+        volume, spacing, fraction = update
+        if self.streaming is None:
+            # the loader fills this same buffer in place, so it is imported once and only refreshed after
+            self.streaming = np.array(spacing)
+            self.scans = volume
+            self.scansStart = (0, 0, 0)
+            self.coarseScans = None
+            self.coarseFactor = None
+            self.resetDirectModel()
+        else:
+            self.volumeImport.refresh()
+            self.vtkWidget.update()
+
+    def showStudy(self, folder, vr):
+        self.streaming = None
+        self.readData(folder, vr)
+        self.cropAction.setChecked(False)
+        self.applyStatistics()
+        # smoothing may have changed the streamed buffer after its last refresh
+        self.volumeImport.refresh()
+        self.showDirect()
+
+    def applyStatistics(self):
+        stats = self.vr.statistics()
+        summary = stats.summary()
+        low, high = stats.suggest_window()
+        for slider in (self.s2, self.s3):
+            slider.blockSignals(True)
+            slider.setMinimum(summary['min'])
+            slider.setMaximum(summary['max'])
+        self.s2.setValue(low)
+        self.s3.setValue(high)
+        self.s2.blockSignals(False)
+        self.s3.blockSignals(False)
+        self.opacityChanged()
+        self.isoThresh.setPlaceholderText(str(stats.suggest_threshold()))
+
+    def showDirect(self, result=None):
         self.directVolumeRenader()
         self.resetDirectModel()
 
+    def runTask(self, fn, done, partial=None):
+        if self.worker is not None:
+            return False
+        self.worker = Worker(fn)
+        self.worker.signals.progress.connect(self.taskProgress)
+        if partial is not None:
+            self.worker.signals.partial.connect(partial)
+        self.worker.signals.finished.connect(lambda result: self.taskFinished(done, result))
+        self.worker.signals.failed.connect(self.taskFailed)
+        self.progressBar.setValue(0)
+        self.progressBar.show()
+        self.cancelButton.show()
+        instrumentation.emit('task', state='started')
+        self.pool.start(self.worker)
+        return True
+
+    def cancelTask(self):
+        if self.worker is not None:
+            self.worker.task.cancel()
+
+    def taskProgress(self, fraction, stage):
+        self.progressBar.setFormat(stage + " %p%")
+        self.progressBar.setValue(int(fraction * 100))
+
+    def taskFinished(self, done, result):
+        instrumentation.emit('task', state='finished')
+        self.endTask()
+        done(result)
+
+    def taskFailed(self, error):
+        instrumentation.emit('task', state='cancelled' if isinstance(error, Cancelled) else 'failed', error=repr(error))
+        self.endTask()
+        if self.streaming is not None:
+            # drop the half-loaded study and go back to whatever was shown before
+            self.streaming = None
+            if self.vr is not None:
+                self.showDirect()
+            else:
+                self.scene.clear()
+                self.vtkWidget.update()
+        if isinstance(error, Cancelled):
+            self.statusBar().showMessage("Скасовано", 3000)
+        else:
+            self.statusBar().showMessage("Помилка: %s" % error)
+
+    def endTask(self):
+        self.worker = None
+        self.progressBar.hide()
+        self.cancelButton.hide()
+
     def __init__(self, parent = None):
         Qt.QMainWindow.__init__(self, parent)
         self.initModelParams()
@@ -209,10 +294,27 @@ class MainWindow(Qt.QMainWindow):
 
     def initModelParams(self):
         self.vr = None
-        self.volumeScalarOpacity = vtk.vtkPiecewiseFunction()
-        self.volumeProperty = vtk.vtkVolumeProperty()
+        self.streaming = None
+        self.streamStep = 8
+        self.worker = None
+        self.pool = QThreadPool.globalInstance()
+        self.cache = VolumeCache(max_bytes=default_cache_bytes())
+        self.scene = Scene()
+        self.volumeScalarOpacity = self.scene.scalar_opacity
+        self.volumeProperty = self.scene.volume_property
         self.setOpacity(0.05)
-        self.reader = vtk.vtkImageImport()
+        self.volumeImport = self.scene.volume_import
+        self.reader = self.volumeImport.reader
+        self.coarseImport = VolumeImport()
+        self.coarseReader = self.coarseImport.reader
+        self.coarseScans = None
+        self.coarseFactor = None
+        self.scansStart = self.coarseStart = (0, 0, 0)
+        self.lodVoxels = 256 ** 3
+        self.interactive = False
+        self.volumeMapper = None
+        self.surfaceCache = SurfaceCache()
+        self.initIndirectPipeline()
         self.ambient, self.diffuse, self.specular = 0.5,0.5,0.5
         self.shape = (0,0,0)
 
@@ -222,7 +324,7 @@ class MainWindow(Qt.QMainWindow):
 
         self.vtkWidget = QVTKRenderWindowInteractor(self.frame)
         self.vl.addWidget(self.vtkWidget)
-        self.ren = vtk.vtkRenderer()
+        self.ren = self.scene.renderer
         self.vtkWidget.GetRenderWindow().AddRenderer(self.ren)
         self.iren = self.vtkWidget.GetRenderWindow().GetInteractor()
 
@@ -347,10 +449,21 @@ class MainWindow(Qt.QMainWindow):
         self.frame.setLayout(self.vl)
         self.setCentralWidget(self.frame)
 
+        self.progressBar = QProgressBar()
+        self.progressBar.setRange(0, 100)
+        self.progressBar.hide()
+        self.statusBar().addPermanentWidget(self.progressBar)
+        self.cancelButton = QPushButton("Скасувати")
+        self.cancelButton.clicked.connect(self.cancelTask)
+        self.cancelButton.hide()
+        self.statusBar().addPermanentWidget(self.cancelButton)
+
         self.boxWidget = vtk.vtkBoxWidget()
         self.boxWidget.SetInteractor(self.iren)
         self.boxWidget.SetPlaceFactor(1.0)
 
+        self.vtkWidget.GetRenderWindow().AddObserver("StartEvent", self.levelOfDetail)
+
         self.show()
         self.iren.Initialize()
         self.iren.Start()
@@ -363,8 +476,40 @@ class MainWindow(Qt.QMainWindow):
         load.triggered.connect(self.initModel)
 
         menubar = self.menuBar()
+        export = QAction('Export STL', self)
+        export.setShortcut('Ctrl+S')
+        export.setStatusTip('Export isosurface mesh')
+        export.triggered.connect(self.export)
+
         fileMenu = menubar.addMenu('&File')
         fileMenu.addAction(load)
+        fileMenu.addAction(export)
+
+        undo = QAction('Undo', self)
+        undo.setShortcut('Ctrl+Z')
+        undo.triggered.connect(self.undo)
+        redo = QAction('Redo', self)
+        redo.setShortcut('Ctrl+Shift+Z')
+        redo.triggered.connect(self.redo)
+
+        self.cropAction = QAction('Crop to box', self)
+        self.cropAction.setShortcut('Ctrl+K')
+        self.cropAction.setCheckable(True)
+        self.cropAction.triggered.connect(self.crop)
+
+        editMenu = menubar.addMenu('&Edit')
+        editMenu.addAction(undo)
+        editMenu.addAction(redo)
+        editMenu.addAction(self.cropAction)
+
+    def levelOfDetail(self, obj, event):
+        # camera and box widget interaction raise the desired update rate until released
+        interactive = obj.GetDesiredUpdateRate() > self.iren.GetStillUpdateRate()
+        if interactive == self.interactive or self.coarseScans is None or self.volumeMapper is None:
+            return
+        self.interactive = interactive
+        reader = self.coarseReader if interactive else self.reader
+        self.volumeMapper.SetInputConnection(reader.GetOutputPort())
 
     def opacityChanged(self):
         opacity = self.sl.value() / 100.0
@@ -377,39 +522,65 @@ class MainWindow(Qt.QMainWindow):
         self.ambient = self.s4.value() / 100.0
         self.diffuse = self.s5.value() / 100.0
         self.specular = self.s6.value() / 100.0
-        self.volumeProperty.SetAmbient(self.ambient)
-        self.volumeProperty.SetDiffuse(self.diffuse)
-        self.volumeProperty.SetSpecular(self.specular)
+        self.scene.set_lighting(self.ambient, self.diffuse, self.specular)
         self.vtkWidget.update()
 
     def setOpacity(self, opacity, minValue=-500, maxValue=1000):
-        print(opacity, minValue, maxValue)
-        self.volumeScalarOpacity.RemoveAllPoints()
-        self.volumeScalarOpacity.AddPoint(-1001, 0)
-        self.volumeScalarOpacity.AddPoint(minValue, 0)
-        if minValue < maxValue:
-            self.volumeScalarOpacity.AddPoint(minValue+1, opacity)
-            self.volumeScalarOpacity.AddPoint(maxValue-1, opacity)
-        self.volumeScalarOpacity.AddPoint(maxValue, 0)
-        self.volumeScalarOpacity.AddPoint(1001, 0)
+        instrumentation.emit('opacity', opacity=opacity, min=minValue, max=maxValue)
+        self.scene.set_opacity(opacity, minValue, maxValue)
 
     def seed(self):
         lines = [self.xLineEdit.text(), self.yLineEdit.text(), self.zLineEdit.text()]
         s = [ 0 if l == "" else int(l) for l in lines]
         if self.vr is not None:
-            self.readData(self.folder)
-            self.directVolumeRenader(seed=s)
-            self.resetDirectModel()
+            vr = self.vr
+
+            def grow(task):
+                vr.segmentation(s, progress=task, replace=True)
+            self.runTask(grow, self.showDirect)
 
     def reset(self):
         if self.vr is not None:
             self.resetDirectModel()
 
+    def crop(self, checked):
+        if self.vr is None or self.worker is not None:
+            self.cropAction.setChecked(self.vr is not None and self.vr.roi is not None)
+            return
+        if checked:
+            # the box is in world coordinates, and the full volume starts at the origin
+            polyData = vtk.vtkPolyData()
+            self.boxWidget.GetPolyData(polyData)
+            self.vr.set_roi(roi_slices(polyData.GetBounds(), self.scale, self.vr.layers.base.shape))
+        else:
+            self.vr.set_roi(None)
+        self.showDirect()
+
+    def undo(self):
+        if self.vr is not None and self.worker is None and self.vr.undo():
+            self.showDirect()
+
+    def redo(self):
+        if self.vr is not None and self.worker is None and self.vr.redo():
+            self.showDirect()
+
+    def isoThreshold(self):
+        thresh = self.isoThresh.text() or self.isoThresh.placeholderText()
+        return 0 if thresh == "" else int(thresh)
+
     def isosurface(self):
         if self.vr is not None:
-            thresh = self.isoThresh.text()
-            thresh = 0 if thresh == "" else int(thresh)
-            self.resetIndirectModel(thresh)
+            thresh = self.isoThreshold()
+            self.runTask(lambda task: self.surface(thresh, task), self.showSurface)
+
+    def export(self):
+        if self.vr is not None and self.worker is None:
+            path, _ = QFileDialog.getSaveFileName(self, "Export STL", "model.stl", "STL (*.stl)")
+            if path == "":
+                return
+            thresh = self.isoThreshold()
+            self.runTask(lambda task: self.exportMesh(path, thresh, task),
+                         lambda path: self.statusBar().showMessage("saved %s" % path, 5000))
 
 if __name__ == "__main__":
     app = Qt.QApplication(sys.argv)
@@ -0,0 +1,106 @@
+import functools
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+sink = None
+counters = {}
+lock = threading.Lock()
+
+
+def set_sink(callback):
+    global sink
+    sink = callback
+
+
+def log_to(path):
+    f = open(path, 'a')
+
+    def write(event):
+        line = json.dumps(event, default=repr)
+        with lock:
+            f.write(line + '\n')
+            f.flush()
+
+    set_sink(write)
+    return f
+
+
+def disable():
+    set_sink(None)
+
+
+def enabled():
+    return sink is not None
+
+
+def describe(value):
+    if hasattr(value, 'shape') and hasattr(value, 'dtype') and hasattr(value, 'nbytes'):
+        return {'shape': list(value.shape), 'dtype': str(value.dtype), 'bytes': int(value.nbytes)}
+    if isinstance(value, dict):
+        return {str(k): describe(v) for k, v in value.items()}
+    if isinstance(value, (tuple, list)):
+        if all(isinstance(v, (int, float, str)) or hasattr(v, 'nbytes') for v in value):
+            return [describe(v) for v in value]
+        # e.g. the pydicom headers of a series
+        return {'count': len(value)}
+    return value
+
+
+def peak_rss():
+    # ru_maxrss is in kibibytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def emit(event, **fields):
+    if sink is None:
+        return
+    record = {'event': event, 'time': time.time(), 'thread': threading.current_thread().name}
+    for key, value in fields.items():
+        record[key] = describe(value)
+    sink(record)
+
+
+def count(name, n=1):
+    if sink is None:
+        return
+    with lock:
+        counters[name] = counters.get(name, 0) + n
+        value = counters[name]
+    emit('counter', name=name, value=value)
+
+
+@contextmanager
+def stage(name, **fields):
+    if sink is None:
+        yield fields
+        return
+    start = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        emit('stage', name=name, seconds=time.perf_counter() - start, peak_rss=peak_rss(), **fields)
+
+
+def traced(name=None):
+    def wrap(fn):
+        label = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if sink is None:
+                return fn(*args, **kwargs)
+            with stage(label) as fields:
+                result = fn(*args, **kwargs)
+                if result is not None:
+                    fields['output'] = result
+                return result
+        return inner
+    return wrap
+
+
+if os.environ.get('MEDAR_TRACE'):
+    log_to(os.environ['MEDAR_TRACE'])
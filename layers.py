@@ -0,0 +1,119 @@
+import itertools
+
+import numpy as np
+
+versions = itertools.count()
+
+
+class Layer:
+    def __init__(self, packed, shape, slices, fill=-1000, name=None):
+        self.packed = packed
+        self.shape = shape
+        self.slices = slices
+        self.fill = fill
+        self.name = name
+        self.serial = next(versions)
+
+    @classmethod
+    def from_mask(cls, mask, fill=-1000, name=None):
+        return cls.from_slices(mask.shape, (mask[z] for z in range(mask.shape[0])), fill, name)
+
+    @classmethod
+    def from_predicate(cls, volume, predicate, fill=-1000, name=None):
+        return cls.from_slices(volume.shape, (predicate(s) for s in volume), fill, name)
+
+    @classmethod
+    def from_slices(cls, shape, keep_slices, fill=-1000, name=None):
+        packed = np.empty((shape[0], shape[1], (shape[2] + 7) // 8), dtype=np.uint8)
+        slices = []
+        for z, keep in enumerate(keep_slices):
+            keep = np.asarray(keep, dtype=bool)
+            packed[z] = np.packbits(keep, axis=-1)
+            if not keep.all():
+                slices.append(z)
+        return cls(packed, tuple(shape), np.array(slices, dtype=np.intp), fill, name)
+
+    def keep(self, z):
+        return np.unpackbits(self.packed[z], axis=-1, count=self.shape[-1]).view(bool)
+
+    def mask(self):
+        return np.unpackbits(self.packed, axis=-1, count=self.shape[-1]).view(bool)
+
+    def apply(self, volume):
+        for z in self.slices:
+            volume[z][~self.keep(z)] = self.fill
+        return volume
+
+    @property
+    def nbytes(self):
+        return self.packed.nbytes
+
+
+class LayerStack:
+    def __init__(self, base, in_place=False):
+        base.flags.writeable = False
+        self.base = base
+        self.in_place = in_place
+        self.layers = []
+        self.undone = []
+        self.version = next(versions)
+        self.composed = None
+
+    def volume(self):
+        if not self.layers or self.in_place:
+            return self.base
+        if self.composed is None:
+            volume = np.array(self.base)
+            for layer in self.layers:
+                layer.apply(volume)
+            volume.flags.writeable = False
+            self.composed = volume
+        return self.composed
+
+    def push(self, layer):
+        if layer.shape != self.base.shape:
+            raise ValueError('layer shape %s does not match volume %s' % (layer.shape, self.base.shape))
+        self.layers.append(layer)
+        self.undone = []
+        if self.in_place:
+            # no second copy of the volume: edits go straight into the base and cannot be undone
+            self.base.flags.writeable = True
+            try:
+                layer.apply(self.base)
+            finally:
+                self.base.flags.writeable = False
+        elif self.composed is not None:
+            # composed volumes may be shared with a renderer, so never edit them in place
+            composed = layer.apply(np.array(self.composed))
+            composed.flags.writeable = False
+            self.composed = composed
+        self.version = next(versions)
+
+    def undo(self):
+        if not self.layers or self.in_place:
+            return False
+        self.undone.append(self.layers.pop())
+        self.changed()
+        return True
+
+    def redo(self):
+        if not self.undone or self.in_place:
+            return False
+        self.layers.append(self.undone.pop())
+        self.changed()
+        return True
+
+    def reset(self):
+        if not self.layers or self.in_place:
+            return False
+        self.undone.extend(reversed(self.layers))
+        self.layers = []
+        self.changed()
+        return True
+
+    def state(self):
+        return tuple(layer.serial for layer in self.layers)
+
+    def changed(self):
+        self.composed = None
+        self.version = next(versions)
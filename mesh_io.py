@@ -0,0 +1,187 @@
+import gzip
+import json
+import os
+import struct
+
+import numpy as np
+from stl import mesh as M
+
+from tasks import report
+
+
+def face_normals(vectors):
+    normals = np.cross(vectors[:, 1] - vectors[:, 0], vectors[:, 2] - vectors[:, 0])
+    length = np.linalg.norm(normals, axis=1, keepdims=True)
+    np.divide(normals, length, out=normals, where=length > 0)
+    return normals
+
+
+def vertex_normals(verts, faces):
+    # area-weighted: the unnormalised face normal is twice the triangle area
+    v = verts[faces]
+    n = np.cross(v[:, 1] - v[:, 0], v[:, 2] - v[:, 0])
+    normals = np.zeros((len(verts), 3))
+    for i in range(3):
+        normals += np.stack([np.bincount(faces[:, i], n[:, k], minlength=len(verts)) for k in range(3)], axis=1)
+    length = np.linalg.norm(normals, axis=1, keepdims=True)
+    np.divide(normals, length, out=normals, where=length > 0)
+    return normals
+
+
+def reorder_vertices(verts, faces, normals=None):
+    # number vertices by first use so index deltas stay small and compress well
+    _, first = np.unique(faces.ravel(), return_index=True)
+    order = faces.ravel()[np.sort(first)]
+    index = np.empty(len(verts), dtype=np.int64)
+    index[order] = np.arange(len(order))
+    return verts[order], index[faces], None if normals is None else normals[order]
+
+
+def quantize(verts, bits=16):
+    lo = verts.min(axis=0)
+    # one step on every axis keeps the glTF node scale uniform, so the normals need no correcting
+    step = np.full(3, (verts.max(axis=0) - lo).max() / (2 ** bits - 1), dtype=np.float64)
+    step[step == 0] = 1
+    return np.rint((verts - lo) / step).astype(np.uint32), lo, step
+
+
+def open_output(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wb', compresslevel=6)
+    return open(path, 'wb')
+
+
+def mesh_format(path):
+    root = path[:-3] if path.endswith('.gz') else path
+    return os.path.splitext(root)[1].lower().lstrip('.')
+
+
+def write_stl(path, verts, faces, chunk_size=1 << 18, header=b'MEDAR binary STL', progress=None):
+    faces = np.asarray(faces)
+    buf = np.zeros(max(1, min(chunk_size, len(faces))), dtype=M.Mesh.dtype)
+    with open_output(path) as f:
+        f.write(header[:80].ljust(80, b' '))
+        f.write(np.uint32(len(faces)).tobytes())
+        for start in range(0, len(faces), chunk_size):
+            chunk = buf[:len(faces[start:start + chunk_size])]
+            chunk['vectors'] = verts[faces[start:start + chunk_size]]
+            chunk['normals'] = face_normals(chunk['vectors'])
+            f.write(chunk.tobytes())
+            report(progress, min(1.0, (start + chunk_size) / len(faces)), 'save')
+    return path
+
+
+def write_ply(path, verts, faces, normals=None, bits=None, progress=None):
+    if bits is not None:
+        # snapped to a grid the float positions stay readable everywhere but gzip far better
+        q, lo, step = quantize(verts, bits)
+        verts = q * step + lo
+    columns = [verts] if normals is None else [verts, normals]
+    vertex = np.ascontiguousarray(np.hstack(columns), dtype='<f4')
+    face = np.empty(len(faces), dtype=[('n', 'u1'), ('v', '<i4', (3,))])
+    face['n'] = 3
+    face['v'] = faces
+    header = ['ply', 'format binary_little_endian 1.0', 'comment MEDAR',
+              'element vertex %d' % len(verts), 'property float x', 'property float y', 'property float z']
+    if normals is not None:
+        header += ['property float nx', 'property float ny', 'property float nz']
+    header += ['element face %d' % len(faces), 'property list uchar int vertex_indices', 'end_header']
+    with open_output(path) as f:
+        f.write(('\n'.join(header) + '\n').encode('ascii'))
+        f.write(vertex.tobytes())
+        report(progress, 0.5, 'save')
+        f.write(face.tobytes())
+    report(progress, 1, 'save')
+    return path
+
+
+def write_glb(path, verts, faces, normals=None, bits=None, progress=None):
+    views, accessors, chunks = [], [], []
+    offset = 0
+
+    def add(data, target, stride=None, **accessor):
+        nonlocal offset
+        data = data.tobytes()
+        view = {'buffer': 0, 'byteOffset': offset, 'byteLength': len(data), 'target': target}
+        if stride is not None:
+            view['byteStride'] = stride
+        views.append(view)
+        accessors.append(dict(bufferView=len(views) - 1, **accessor))
+        padding = -len(data) % 4
+        chunks.append(data + b'\0' * padding)
+        offset += len(data) + padding
+        return len(accessors) - 1
+
+    node = {'mesh': 0}
+    attributes = {}
+    if bits is None:
+        v = np.ascontiguousarray(verts, dtype='<f4')
+        attributes['POSITION'] = add(v, 34962, count=len(v), type='VEC3', componentType=5126,
+                                     min=v.min(axis=0).tolist(), max=v.max(axis=0).tolist())
+    else:
+        # KHR_mesh_quantization: integer positions, the node transform maps them back to millimetres
+        q, lo, step = quantize(verts, min(bits, 16))
+        padded = np.zeros((len(q), 4), dtype='<u2')
+        padded[:, :3] = q
+        attributes['POSITION'] = add(padded, 34962, 8, count=len(q), type='VEC3', componentType=5123,
+                                     min=q.min(axis=0).tolist(), max=q.max(axis=0).tolist())
+        node['translation'] = lo.tolist()
+        node['scale'] = step.tolist()
+    if normals is not None:
+        if bits is None:
+            attributes['NORMAL'] = add(np.ascontiguousarray(normals, dtype='<f4'), 34962,
+                                       count=len(normals), type='VEC3', componentType=5126)
+        else:
+            padded = np.zeros((len(normals), 4), dtype='i1')
+            padded[:, :3] = np.rint(np.clip(normals, -1, 1) * 127)
+            attributes['NORMAL'] = add(padded, 34962, 4, count=len(normals), type='VEC3',
+                                       componentType=5120, normalized=True)
+    small = len(verts) < 65536
+    indices = np.ascontiguousarray(faces, dtype='<u2' if small else '<u4').ravel()
+    index = add(indices, 34963, count=len(indices), type='SCALAR', componentType=5123 if small else 5125)
+    report(progress, 0.5, 'save')
+
+    gltf = {
+        'asset': {'version': '2.0', 'generator': 'MEDAR'},
+        'scene': 0,
+        'scenes': [{'nodes': [0]}],
+        'nodes': [node],
+        'meshes': [{'primitives': [{'attributes': attributes, 'indices': index, 'mode': 4}]}],
+        'accessors': accessors,
+        'bufferViews': views,
+        'buffers': [{'byteLength': offset}],
+    }
+    if bits is not None:
+        gltf['extensionsUsed'] = gltf['extensionsRequired'] = ['KHR_mesh_quantization']
+    text = json.dumps(gltf, separators=(',', ':')).encode('utf-8')
+    text += b' ' * (-len(text) % 4)
+    with open_output(path) as f:
+        f.write(struct.pack('<4sII', b'glTF', 2, 12 + 8 + len(text) + 8 + offset))
+        f.write(struct.pack('<I4s', len(text), b'JSON'))
+        f.write(text)
+        f.write(struct.pack('<I4s', offset, b'BIN\0'))
+        for chunk in chunks:
+            f.write(chunk)
+    report(progress, 1, 'save')
+    return path
+
+
+MESH_FORMATS = ('stl', 'ply', 'glb')
+
+
+def write_mesh(path, verts, faces, normals=None, bits=None, chunk_size=1 << 18, progress=None):
+    fmt = mesh_format(path)
+    if fmt not in MESH_FORMATS:
+        raise ValueError('unknown mesh format %r, expected one of %s' % (fmt, MESH_FORMATS))
+    faces = np.asarray(faces)
+    if fmt == 'stl':
+        return write_stl(path, verts, faces, chunk_size, progress=progress)
+    if normals is None:
+        normals = vertex_normals(verts, faces)
+    verts, faces, normals = reorder_vertices(np.asarray(verts), faces, normals)
+    if fmt == 'ply':
+        return write_ply(path, verts, faces, normals, bits, progress)
+    return write_glb(path, verts, faces, normals, bits, progress)
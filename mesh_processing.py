@@ -0,0 +1,201 @@
+import numpy as np
+import scipy.sparse as sp
+
+
+def weld_vertices(verts, faces, tolerance=1e-6):
+    key = np.round(np.asarray(verts, dtype=np.float64) / tolerance).astype(np.int64)
+    _, first, inverse = np.unique(key, axis=0, return_index=True, return_inverse=True)
+    return verts[first], inverse.reshape(-1)[faces]
+
+
+def remove_degenerate(faces):
+    a, b, c = faces.T
+    faces = faces[(a != b) & (b != c) & (a != c)]
+    # the same triangle listed twice, in any winding
+    _, unique = np.unique(np.sort(faces, axis=1), axis=0, return_index=True)
+    return faces[np.sort(unique)]
+
+
+def compact(verts, faces):
+    used = np.zeros(len(verts), dtype=bool)
+    used[faces] = True
+    index = np.cumsum(used) - 1
+    return verts[used], index[faces]
+
+
+def clean(verts, faces, tolerance=1e-6):
+    verts, faces = weld_vertices(verts, faces, tolerance)
+    return compact(verts, remove_degenerate(faces))
+
+
+def unique_edges(faces):
+    edges = np.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+    # one int64 key per edge sorts far faster than unique rows
+    n = int(faces.max()) + 1 if len(faces) else 1
+    keys, counts = np.unique(edges[:, 0] * n + edges[:, 1], return_counts=True)
+    return np.stack([keys // n, keys % n], axis=1), counts
+
+
+def normals(verts, faces):
+    v = verts[faces]
+    return np.cross(v[:, 1] - v[:, 0], v[:, 2] - v[:, 0])
+
+
+def quadrics(verts, faces):
+    n = normals(verts, faces)
+    area = np.linalg.norm(n, axis=1)
+    np.divide(n, area[:, None], out=n, where=area[:, None] > 0)
+    plane = np.concatenate([n, -(n * verts[faces[:, 0]]).sum(axis=1, keepdims=True)], axis=1)
+    # area-weighted plane quadrics, summed onto the three corners of every face
+    k = (plane[:, :, None] * plane[:, None, :] * (area / 2)[:, None, None]).reshape(-1, 16)
+    corners = faces.ravel()
+    weights = np.repeat(k, 3, axis=0)
+    q = np.stack([np.bincount(corners, weights[:, i], minlength=len(verts)) for i in range(16)], axis=1)
+    return q.reshape(-1, 4, 4)
+
+
+def collapse_targets(verts, q, edges):
+    a, b = edges.T
+    qe = q[a] + q[b]
+    mid = (verts[a] + verts[b]) / 2
+    optimal = mid.copy()
+    A = qe[:, :3, :3]
+    scale = np.abs(A).max(axis=(1, 2)) + 1e-30
+    solvable = np.abs(np.linalg.det(A / scale[:, None, None])) > 1e-6
+    if solvable.any():
+        optimal[solvable] = np.linalg.solve(A[solvable], -qe[solvable, :3, 3:])[..., 0]
+    # a nearly flat neighbourhood can put the optimum far off the edge
+    length = np.linalg.norm(verts[a] - verts[b], axis=1)
+    far = np.linalg.norm(optimal - mid, axis=1) > length
+    optimal[far] = mid[far]
+    candidates = np.stack([optimal, mid, verts[a], verts[b]], axis=1)
+    h = np.concatenate([candidates, np.ones(candidates.shape[:2] + (1,))], axis=2)
+    cost = np.einsum('eci,eij,ecj->ec', h, qe, h)
+    best = np.argmin(cost, axis=1)
+    rows = np.arange(len(edges))
+    return candidates[rows, best], np.maximum(cost[rows, best], 0)
+
+
+def independent(edges, priority, faces, n):
+    # an edge is taken only if it ranks first among the edges touching any face around either end,
+    # so no face is changed by two collapses of the same batch
+    rank = np.empty(len(edges), dtype=np.int64)
+    rank[np.argsort(priority, kind='stable')] = np.arange(len(edges))
+    vertex = np.full(n, len(edges), dtype=np.int64)
+    np.minimum.at(vertex, edges[:, 0], rank)
+    np.minimum.at(vertex, edges[:, 1], rank)
+    ring = np.full(n, len(edges), dtype=np.int64)
+    np.minimum.at(ring, faces.ravel(), np.repeat(vertex[faces].min(axis=1), 3))
+    return np.flatnonzero((ring[edges[:, 0]] == rank) & (ring[edges[:, 1]] == rank))
+
+
+def rejected(verts, faces, a, b, positions):
+    owner = np.full(len(verts), -1)
+    owner[a] = owner[b] = np.arange(len(a))
+    remap = np.arange(len(verts))
+    remap[b] = a
+    moved = verts.copy()
+    moved[a] = positions
+    changed = (owner[faces] >= 0).any(axis=1)
+    before = faces[changed]
+    after = remap[before]
+    by = owner[before].max(axis=1)
+    kept = (after[:, 0] != after[:, 1]) & (after[:, 1] != after[:, 2]) & (after[:, 0] != after[:, 2])
+    # collapses that flip a surviving triangle over
+    flipped = (normals(verts, before) * normals(moved, after)).sum(axis=1) <= 0
+    bad = set(by[kept & flipped].tolist())
+    # or that leave an edge shared by more than two triangles
+    result = remap[faces]
+    result = result[(result[:, 0] != result[:, 1]) & (result[:, 1] != result[:, 2]) & (result[:, 0] != result[:, 2])]
+    edges, counts = unique_edges(result)
+    bad.update(owner[edges[counts > 2].ravel()].tolist())
+    bad.discard(-1)
+    return np.array(sorted(bad), dtype=np.int64)
+
+
+def decimate(verts, faces, target_faces=None, max_error=None, max_iterations=200, fraction=0.25, seed=0):
+    verts = np.array(verts, dtype=np.float64)
+    faces = np.array(faces, dtype=np.int64)
+    q = quadrics(verts, faces)
+    rng = np.random.default_rng(seed)
+    error = 0.0
+    for _ in range(max_iterations):
+        if target_faces is not None and len(faces) <= target_faces:
+            break
+        edges, counts = unique_edges(faces)
+        # boundary and non-manifold edges pin their vertices so open borders keep their outline
+        locked = np.zeros(len(verts), dtype=bool)
+        locked[edges[counts != 2].ravel()] = True
+        edges = edges[~locked[edges].any(axis=1)]
+        if len(edges) == 0:
+            break
+        positions, cost = collapse_targets(verts, q, edges)
+        if max_error is not None:
+            within = cost <= max_error
+            edges, positions, cost = edges[within], positions[within], cost[within]
+            if len(edges) == 0:
+                break
+        # random priorities among the cheapest edges give many local winners per batch,
+        # where ranking by cost alone leaves one per smooth stretch of the cost field
+        cheap = np.flatnonzero(cost <= np.quantile(cost, fraction))
+        chosen = cheap[independent(edges[cheap], rng.random(len(cheap)), faces, len(verts))]
+        if target_faces is not None:
+            # every interior collapse removes two triangles
+            limit = max(1, (len(faces) - target_faces + 1) // 2)
+            chosen = chosen[np.argsort(cost[chosen], kind='stable')[:limit]]
+        a, b = edges[chosen].T
+        bad = rejected(verts, faces, a, b, positions[chosen])
+        good = np.ones(len(chosen), dtype=bool)
+        good[bad] = False
+        if not good.any():
+            break
+        chosen, a, b = chosen[good], a[good], b[good]
+        verts[a] = positions[chosen]
+        q[a] += q[b]
+        remap = np.arange(len(verts))
+        remap[b] = a
+        faces = remap[faces]
+        faces = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])]
+        error = max(error, float(cost[chosen].max()))
+    verts, faces = compact(verts, faces)
+    return verts, faces, error
+
+
+def adjacency(faces, n):
+    edges = faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2)
+    A = sp.coo_matrix((np.ones(len(edges)), (edges[:, 0], edges[:, 1])), shape=(n, n))
+    A = (A + A.T).tocsr()
+    A.data[:] = 1
+    return A
+
+
+def laplacian_smooth(verts, faces, iterations=10, lamb=0.5, mu=None):
+    A = adjacency(faces, len(verts))
+    degree = np.asarray(A.sum(axis=1)).ravel()
+    degree[degree == 0] = 1
+    verts = np.array(verts, dtype=np.float64)
+    factors = (lamb,) if mu is None else (lamb, mu)
+    for _ in range(iterations):
+        for factor in factors:
+            verts += factor * (A.dot(verts) / degree[:, None] - verts)
+    return verts
+
+
+def taubin_smooth(verts, faces, iterations=10, lamb=0.5, mu=-0.53):
+    # the negative second step undoes the shrinking of plain Laplacian smoothing
+    return laplacian_smooth(verts, faces, iterations, lamb, mu)
+
+
+def simplify(verts, faces, target_faces=None, max_error=None, smoothing=0, tolerance=1e-6):
+    stats = {'verts_in': int(len(verts)), 'faces_in': int(len(faces))}
+    dtype = verts.dtype
+    verts, faces = clean(verts, faces, tolerance)
+    stats['faces_clean'] = int(len(faces))
+    if target_faces is not None or max_error is not None:
+        verts, faces, stats['error'] = decimate(verts, faces, target_faces, max_error)
+    if smoothing:
+        verts = taubin_smooth(verts, faces, smoothing)
+    stats['verts_out'] = int(len(verts))
+    stats['faces_out'] = int(len(faces))
+    stats['reduction'] = 1 - len(faces) / max(1, stats['faces_in'])
+    return verts.astype(dtype, copy=False), faces, stats
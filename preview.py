@@ -0,0 +1,90 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+PREVIEWS = ('axial', 'coronal', 'sagittal',
+            'mip_axial', 'mip_coronal', 'mip_sagittal',
+            'mean_axial', 'mean_coronal', 'mean_sagittal')
+
+
+def project(volume, slab=32, position=None):
+    # one pass over z-slabs fills every slice and projection, so a memory-mapped volume is read once
+    Z, Y, X = volume.shape
+    z0, y0, x0 = (Z // 2, Y // 2, X // 2) if position is None else position
+    views = {
+        'coronal': np.empty((Z, X), volume.dtype),
+        'sagittal': np.empty((Z, Y), volume.dtype),
+        'mip_coronal': np.empty((Z, X), volume.dtype),
+        'mip_sagittal': np.empty((Z, Y), volume.dtype),
+        'mean_coronal': np.empty((Z, X), np.float32),
+        'mean_sagittal': np.empty((Z, Y), np.float32),
+    }
+    mip = None
+    total = np.zeros((Y, X), np.float64)
+    for start in range(0, Z, slab):
+        block = np.asarray(volume[start:start + slab])
+        rows = slice(start, start + len(block))
+        top = block.max(axis=0)
+        mip = top if mip is None else np.maximum(mip, top, out=mip)
+        total += block.sum(axis=0, dtype=np.float64)
+        views['coronal'][rows] = block[:, y0]
+        views['sagittal'][rows] = block[:, :, x0]
+        views['mip_coronal'][rows] = block.max(axis=1)
+        views['mip_sagittal'][rows] = block.max(axis=2)
+        views['mean_coronal'][rows] = block.mean(axis=1)
+        views['mean_sagittal'][rows] = block.mean(axis=2)
+        if start <= z0 < start + len(block):
+            views['axial'] = block[z0 - start].copy()
+    views['mip_axial'] = mip
+    views['mean_axial'] = (total / Z).astype(np.float32)
+    return views
+
+
+def window(image, low, high):
+    scale = 255.0 / max(high - low, 1)
+    return np.clip((image.astype(np.float32) - low) * scale, 0, 255).astype(np.uint8)
+
+
+def thumbnail(image, extent, size):
+    # extent is the physical height and width, so coronal and sagittal views keep their proportions
+    h, w = extent
+    shape = (max(1, int(round(size * w / max(h, w)))), max(1, int(round(size * h / max(h, w)))))
+    return cv2.resize(image, shape, interpolation=cv2.INTER_AREA)
+
+
+def render_previews(volume, spacing=(1, 1, 1), low=-1000, high=1000, size=256, names=PREVIEWS, slab=32):
+    Z, Y, X = np.asarray(volume.shape) * np.asarray(spacing, dtype=np.float64)
+    extents = {'axial': (Y, X), 'coronal': (Z, X), 'sagittal': (Z, Y)}
+    views = project(volume, slab)
+    return {name: thumbnail(window(views[name], low, high), extents[name.rsplit('_', 1)[-1]], size)
+            for name in names}
+
+
+def write_previews(directory, images, info=None):
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for name, image in images.items():
+        paths[name] = os.path.join(directory, name + '.png')
+        cv2.imwrite(paths[name], image)
+    if info is not None:
+        with open(os.path.join(directory, 'previews.json'), 'w') as f:
+            json.dump(info, f)
+    return paths
+
+
+def read_previews(directory, names, info=None):
+    try:
+        with open(os.path.join(directory, 'previews.json')) as f:
+            if info is not None and json.load(f) != info:
+                return None
+    except (OSError, ValueError):
+        return None
+    images = {}
+    for name in names:
+        image = cv2.imread(os.path.join(directory, name + '.png'), cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            return None
+        images[name] = image
+    return images
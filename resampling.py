@@ -0,0 +1,51 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import scipy.ndimage as ndi
+
+from helper import accepts
+
+
+def open_output(out, shape, dtype):
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+    if isinstance(out, str):
+        return np.memmap(out, dtype=dtype, mode='w+', shape=shape)
+    if out.shape != shape:
+        raise ValueError('output shape %s does not match resampled shape %s' % (out.shape, shape))
+    return out
+
+
+def store(target, values):
+    if np.issubdtype(target.dtype, np.integer):
+        info = np.iinfo(target.dtype)
+        np.rint(values, out=values)
+        np.clip(values, info.min, info.max, out=values)
+    target[...] = values
+
+
+@accepts()
+def resample_volume(volume, shape, order=1, dtype=None, out=None, workers=None, slab=16, halo=None):
+    shape = tuple(int(s) for s in shape)
+    out = open_output(out, shape, np.dtype(volume.dtype if dtype is None else dtype))
+    # same grid as ndimage.zoom: output index o samples input coordinate o * (n_in - 1) / (n_out - 1)
+    scale = np.array([(i - 1) / (o - 1) if o > 1 else 0.0 for i, o in zip(volume.shape, shape)])
+    if halo is None:
+        # higher-order splines are prefiltered per slab, so give them more context
+        halo = order + 1 if order < 2 else 8
+
+    def run(start):
+        stop = min(start + slab, shape[0])
+        lo = max(0, int(np.floor(start * scale[0])) - halo)
+        hi = min(volume.shape[0], int(np.ceil((stop - 1) * scale[0])) + halo + 1)
+        values = ndi.affine_transform(np.asarray(volume[lo:hi], dtype=np.float32), scale,
+                                      offset=(start * scale[0] - lo, 0, 0),
+                                      output_shape=(stop - start,) + shape[1:],
+                                      output=np.float32, order=order, mode='nearest')
+        store(out[start:stop], values)
+
+    with ThreadPoolExecutor(workers) as pool:
+        list(pool.map(run, range(0, shape[0], slab)))
+    if isinstance(out, np.memmap):
+        out.flush()
+    return out
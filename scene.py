@@ -0,0 +1,325 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import vtk
+
+from tasks import Cancelled, report
+from vtk_bridge import VolumeImport
+
+MAPPERS = {
+    'gpu': vtk.vtkGPUVolumeRayCastMapper,
+    'smart': vtk.vtkSmartVolumeMapper,
+    'cpu': vtk.vtkFixedPointVolumeRayCastMapper,
+}
+
+
+def color_transfer():
+    color = vtk.vtkColorTransferFunction()
+    color.AddRGBPoint(-1000, 0.00, 0.00, 0.00)
+    color.AddRGBPoint(-600, 0.76, 0.41, 0.32)
+    color.AddRGBPoint(-400, 0.76, 0.41, 0.32)
+    color.AddRGBPoint(-100, 0.76, 0.65, 0.45)
+    color.AddRGBPoint(-60, 0.76, 0.65, 0.45)
+    color.AddRGBPoint(40, 0.40, 0.00, 0.00)
+    color.AddRGBPoint(80, 0.60, 0.00, 0.00)
+    color.AddRGBPoint(400, 1.00, 1.00, 0.90)
+    color.AddRGBPoint(1000, 1.00, 1.00, 0.90)
+    return color
+
+
+def gradient_opacity():
+    opacity = vtk.vtkPiecewiseFunction()
+    opacity.AddPoint(0, 0.0)
+    opacity.AddPoint(90, 0.5)
+    opacity.AddPoint(100, 1.0)
+    return opacity
+
+
+def scalar_opacity(function, opacity, minValue=-500, maxValue=1000):
+    function.RemoveAllPoints()
+    function.AddPoint(-1001, 0)
+    function.AddPoint(minValue, 0)
+    if minValue < maxValue:
+        function.AddPoint(minValue + 1, opacity)
+        function.AddPoint(maxValue - 1, opacity)
+    function.AddPoint(maxValue, 0)
+    function.AddPoint(1001, 0)
+
+
+def import_volume(volume_import, scans, scale, factor=1, start=(0, 0, 0)):
+    # start is the (x, y, z) index of the first voxel of a volume cropped to a region of interest;
+    # coarse voxels sit at the centre of the block they average
+    origin = tuple(s * (i * factor + (factor - 1) / 2.0) for s, i in zip(scale, start))
+    return volume_import.set_volume(scans, tuple(s * factor for s in scale), origin)
+
+
+def outline_actor(port, color=None):
+    outline = vtk.vtkOutlineFilter()
+    outline.SetInputConnection(port)
+    mapper = vtk.vtkPolyDataMapper()
+    mapper.SetInputConnection(outline.GetOutputPort())
+    actor = vtk.vtkActor()
+    actor.SetMapper(mapper)
+    if color is not None:
+        actor.GetProperty().SetColor(*color)
+    return actor
+
+
+class Scene:
+    def __init__(self, renderer=None, mapper='gpu'):
+        self.renderer = vtk.vtkRenderer() if renderer is None else renderer
+        self.mapper = mapper
+        self.volume_import = VolumeImport()
+        self.scalar_opacity = vtk.vtkPiecewiseFunction()
+        scalar_opacity(self.scalar_opacity, 0.05)
+        self.volume_property = vtk.vtkVolumeProperty()
+        self.volume_property.SetColor(color_transfer())
+        self.volume_property.SetScalarOpacity(self.scalar_opacity)
+        self.volume_property.SetGradientOpacity(gradient_opacity())
+        self.volume_property.SetInterpolationTypeToLinear()
+        self.volume_property.ShadeOn()
+        self.set_lighting(0.5, 0.5, 0.5)
+        self.volume_mapper = None
+        self.init_surface_pipeline()
+
+    def init_surface_pipeline(self):
+        self.surface_import = VolumeImport()
+        self.contour = vtk.vtkFlyingEdges3D()
+        self.contour.SetInputConnection(self.surface_import.GetOutputPort())
+        self.contour.ComputeNormalsOff()
+        self.contour.ComputeScalarsOff()
+        self.normals = vtk.vtkPolyDataNormals()
+        self.normals.SetInputConnection(self.contour.GetOutputPort())
+        self.normals.SetFeatureAngle(60.0)
+        self.skin_mapper = vtk.vtkPolyDataMapper()
+        self.skin_mapper.ScalarVisibilityOff()
+        self.skin = vtk.vtkActor()
+        self.skin.SetMapper(self.skin_mapper)
+        # An outline provides context around the data.
+        self.skin_outline = outline_actor(self.volume_import.GetOutputPort(), (0, 0, 0))
+        self.indirect_shown = False
+
+    def set_opacity(self, opacity, minValue=-500, maxValue=1000):
+        scalar_opacity(self.scalar_opacity, opacity, minValue, maxValue)
+
+    def set_lighting(self, ambient, diffuse, specular):
+        self.volume_property.SetAmbient(ambient)
+        self.volume_property.SetDiffuse(diffuse)
+        self.volume_property.SetSpecular(specular)
+
+    def clear(self):
+        self.renderer.Clear()
+        self.renderer.RemoveAllViewProps()
+        self.indirect_shown = False
+
+    def show_direct(self, fit=False):
+        self.clear()
+        self.volume_mapper = MAPPERS[self.mapper]()
+        self.volume_mapper.SetInputConnection(self.volume_import.GetOutputPort())
+        self.volume_mapper.SetBlendModeToComposite()
+        self.volume = vtk.vtkVolume()
+        self.volume.SetMapper(self.volume_mapper)
+        self.volume.SetProperty(self.volume_property)
+
+        camera = self.renderer.GetActiveCamera()
+        c = self.volume.GetCenter()
+        camera.SetFocalPoint(c[0], c[1], c[2])
+        camera.SetPosition(c[0] + 3000, c[1], c[2])
+        camera.SetViewUp(0, 0, 1)
+
+        self.renderer.AddActor(outline_actor(self.volume_import.GetOutputPort()))
+        self.renderer.AddVolume(self.volume)
+        if fit:
+            self.renderer.ResetCamera()
+            camera.Dolly(1.5)
+        self.renderer.SetBackground(0.5, 0.5, 0.5)
+        self.renderer.ResetCameraClippingRange()
+        return self.volume_mapper
+
+    def surface(self, threshold, progress=None):
+        self.contour.SetValue(0, threshold)
+        aborted = []
+
+        def on_progress(obj, event):
+            try:
+                report(progress, obj.GetProgress(), 'isosurface')
+            except Cancelled:
+                aborted.append(True)
+                obj.SetAbortExecute(1)
+
+        tag = self.contour.AddObserver("ProgressEvent", on_progress)
+        try:
+            self.normals.Update()
+        finally:
+            self.contour.RemoveObserver(tag)
+        if aborted:
+            self.contour.SetAbortExecute(0)
+            self.contour.Modified()
+            raise Cancelled()
+        surface = vtk.vtkPolyData()
+        surface.ShallowCopy(self.normals.GetOutput())
+        return surface
+
+    def show_surface(self, surface):
+        self.skin_mapper.SetInputData(surface)
+        if self.indirect_shown:
+            return
+        self.clear()
+        self.renderer.AddActor(self.skin_outline)
+        self.renderer.AddActor(self.skin)
+
+        camera = vtk.vtkCamera()
+        camera.SetViewUp(0, 0, 1)
+        camera.SetPosition(0, -1, 0)
+        camera.SetFocalPoint(0, 0, 0)
+        camera.ComputeViewPlaneNormal()
+
+        self.renderer.SetActiveCamera(camera)
+        self.renderer.ResetCamera()
+        camera.Dolly(1.5)
+
+        self.renderer.SetBackground(0.2, 0.2, 0.2)
+        self.renderer.ResetCameraClippingRange()
+        self.indirect_shown = True
+
+
+def offscreen_window(scene, size=(512, 512)):
+    window = vtk.vtkRenderWindow()
+    window.SetOffScreenRendering(1)
+    window.SetSize(*size)
+    window.AddRenderer(scene.renderer)
+    return window
+
+
+def orbit(window, camera, frames=36, pattern=None):
+    grab = vtk.vtkWindowToImageFilter()
+    grab.SetInput(window)
+    grab.ReadFrontBufferOff()
+    writer = vtk.vtkPNGWriter()
+    writer.SetInputConnection(grab.GetOutputPort())
+    seconds = 0.0
+    for i in range(frames):
+        start = time.perf_counter()
+        window.Render()
+        seconds += time.perf_counter() - start
+        if pattern is not None:
+            grab.Modified()
+            writer.SetFileName(pattern % i)
+            writer.Write()
+        camera.Azimuth(360.0 / frames)
+    return seconds
+
+
+worker = None
+
+
+def init_worker(size, mapper):
+    # one scene and offscreen window per process, reused for every study it renders
+    global worker
+    scene = Scene(mapper=mapper)
+    worker = scene, offscreen_window(scene, size)
+
+
+def render_study(series, directory, spec):
+    # imported here so the scene builder itself does not pull in the loading pipeline
+    from volume_renderer import VolumeRenderer
+    from volume_cache import VolumeCache
+
+    scene, window = worker
+    start = time.perf_counter()
+    vr = VolumeRenderer(series, cache=None if spec['cache'] is None else VolumeCache(spec['cache']))
+    factor = spec['downsample']
+    scans = vr.downsampled((factor,) * 3)
+    scale = list(vr.spacing[::-1])
+    stats = vr.statistics()
+    import_volume(scene.volume_import, scans, scale, factor)
+    if spec['mode'] == 'direct':
+        low, high = spec['window'] or stats.suggest_window()
+        scene.set_opacity(spec['opacity'], low, high)
+        scene.show_direct(fit=True)
+    else:
+        import_volume(scene.surface_import, scans, scale, factor)
+        threshold = stats.suggest_threshold() if spec['threshold'] is None else spec['threshold']
+        scene.clear()
+        scene.show_surface(scene.surface(threshold))
+    loaded = time.perf_counter() - start
+    os.makedirs(directory, exist_ok=True)
+    seconds = orbit(window, scene.renderer.GetActiveCamera(), spec['frames'],
+                    os.path.join(directory, 'frame%03d.png'))
+    return {
+        'frames': spec['frames'],
+        'load_seconds': loaded,
+        'render_seconds': seconds,
+        'fps': spec['frames'] / seconds if seconds > 0 else None,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render camera orbits of DICOM series without a display.')
+    parser.add_argument('series', nargs='+', help='series directories')
+    parser.add_argument('-o', '--output', default='renders', help='directory for frames and the report')
+    parser.add_argument('--mode', choices=('direct', 'surface'), default='direct')
+    parser.add_argument('--frames', type=int, default=36)
+    parser.add_argument('--size', type=int, nargs=2, default=(512, 512), metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--mapper', choices=sorted(MAPPERS), default='gpu')
+    parser.add_argument('--downsample', type=int, default=1)
+    parser.add_argument('--opacity', type=float, default=0.05)
+    parser.add_argument('--window', type=int, nargs=2, default=None, metavar=('LOW', 'HIGH'),
+                        help='HU opacity window, defaults to the histogram suggestion')
+    parser.add_argument('--threshold', type=int, default=None, help='isosurface HU, defaults to Otsu')
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes')
+    parser.add_argument('--cache', help='volume cache directory shared by the workers')
+    args = parser.parse_args(argv)
+
+    spec = {
+        'mode': args.mode,
+        'frames': args.frames,
+        'downsample': args.downsample,
+        'opacity': args.opacity,
+        'window': args.window,
+        'threshold': args.threshold,
+        'cache': args.cache,
+    }
+    start = time.perf_counter()
+    records = []
+    with ProcessPoolExecutor(args.jobs, initializer=init_worker, initargs=(tuple(args.size), args.mapper)) as pool:
+        pending = {}
+        for s in args.series:
+            name = os.path.basename(os.path.abspath(s).rstrip(os.sep))
+            pending[pool.submit(render_study, s, os.path.join(args.output, name), spec)] = s
+        for future in as_completed(pending):
+            s = pending[future]
+            try:
+                record = dict(series=s, status='done', **future.result())
+                print('%-8s %s  %.1f fps' % ('done', s, record['fps'] or 0))
+            except Exception as e:
+                record = dict(series=s, status='failed', error='%s: %s' % (type(e).__name__, e))
+                print('%-8s %s  %s' % ('failed', s, record['error']))
+            records.append(record)
+    done = [r for r in records if r['status'] == 'done']
+    frames = sum(r['frames'] for r in done)
+    render = sum(r['render_seconds'] for r in done)
+    wall = time.perf_counter() - start
+    report = {
+        'run': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'spec': dict(spec, size=list(args.size), mapper=args.mapper),
+        'wall_seconds': wall,
+        'frames': frames,
+        'render_fps': frames / render if render > 0 else None,
+        'throughput_fps': frames / wall if wall > 0 else None,
+        'series': records,
+    }
+    os.makedirs(args.output, exist_ok=True)
+    with open(os.path.join(args.output, 'report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    print('%d frames from %d series in %.1fs: %.1f fps rendering, %.1f fps overall'
+          % (frames, len(done), wall, report['render_fps'] or 0, report['throughput_fps'] or 0))
+    return 0 if len(done) == len(records) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,35 +1,121 @@
 from __future__ import print_function
 
-import matplotlib.pyplot as plt
 import SimpleITK as sitk
 from volume_renderer import *
-import cv2
+from collections import OrderedDict
+
+from component_index import ComponentIndex, DEFAULT_BANDS
+import instrumentation
+from smoothing import smooth
+from tasks import Cancelled, report
 
 
 class Segmentator:
-    def __init__(self, model, blur=True):
+    @instrumentation.traced('Segmentator.prepare')
+    def __init__(self, model, blur=True, close_radius=5, cache_size=16):
+        check_dtype(model, stage='Segmentator')
         if blur:
-            self.model = cv2.blur(model, (11, 11))
+            self.model = smooth(np.array(model, dtype=np.float32), 'box', 11, 'slice')
         else:
             self.model = model
         self.sitkModel = sitk.GetImageFromArray(self.model)
-        print(self.sitkModel.GetSize())
+        self.shape = self.model.shape
+        self.close_radius = close_radius
+        self.cache_size = cache_size
+        self.results = OrderedDict()
+        self.index = None
+        instrumentation.emit('segmentator', size=self.sitkModel.GetSize(), model=self.model)
+
+    def indexComponents(self, bands=DEFAULT_BANDS, workers=None):
+        with instrumentation.stage('Segmentator.indexComponents', bands=len(bands)) as fields:
+            self.index = ComponentIndex(self.sitkModel, bands, workers)
+            fields['bytes'] = self.index.nbytes
+        self.results.clear()
+        return self.index
 
-    def regionGrow(self, seed, close=True):
-        seg = sitk.Image(self.sitkModel.GetSize(), sitk.sitkUInt8)
-        seg.CopyInformation(self.sitkModel)
-        seg[seed] = 1
+    @instrumentation.traced()
+    def connectedThreshold(self, seed, tolerance, progress=None):
         v = self.sitkModel[seed]
-        seg = sitk.ConnectedThreshold(image1=self.sitkModel,
-                                      seedList=[seed],
-                                      lower=int(v - 10),
-                                      upper=int(v + 10),
-                                      replaceValue=1)
-        s = sitk.GetArrayFromImage(seg)
+        grow = sitk.ConnectedThresholdImageFilter()
+        grow.SetSeedList([seed])
+        grow.SetLower(int(v - tolerance))
+        grow.SetUpper(int(v + tolerance))
+        grow.SetReplaceValue(1)
+        aborted = []
+
+        def onProgress():
+            try:
+                report(progress, grow.GetProgress(), 'region growing')
+            except Cancelled:
+                aborted.append(True)
+                grow.Abort()
+
+        if progress is not None:
+            grow.AddCommand(sitk.sitkProgressEvent, onProgress)
+        try:
+            seg = grow.Execute(self.sitkModel)
+        except RuntimeError:
+            if aborted:
+                raise Cancelled()
+            raise
+        return sitk.GetArrayFromImage(seg)
+
+    def bounds(self, s, pad=0):
+        box = []
+        for axis in range(3):
+            other = tuple(a for a in range(3) if a != axis)
+            hit = np.flatnonzero(s.any(axis=other))
+            box.append(slice(max(0, hit[0] - pad), min(s.shape[axis], hit[-1] + 1 + pad)))
+        return tuple(box)
+
+    @instrumentation.traced()
+    def close(self, region):
+        # 3D closing restricted to the grown region's padded bounding box
+        closed = sitk.BinaryMorphologicalClosing(sitk.GetImageFromArray(region.astype(np.uint8)),
+                                                 [self.close_radius] * 3, sitk.sitkBox)
+        return sitk.GetArrayFromImage(closed).astype(bool)
+
+    def grow(self, seed, tolerance=10, close=True, progress=None):
+        seed = tuple(int(c) for c in seed)
+        key = (seed, tolerance, close)
+        if key in self.results:
+            instrumentation.count('segmentator.hit')
+            self.results.move_to_end(key)
+            return self.results[key]
+        instrumentation.count('segmentator.miss')
+        pad = self.close_radius if close else 0
+        # with a component index the seed's band replaces the tolerance window
+        found = None if self.index is None else self.index.query(seed, self.sitkModel[seed], pad)
+        if found is None:
+            s = self.connectedThreshold(seed, tolerance, progress)
+            box = self.bounds(s, pad)
+            region = np.array(s[box], dtype=bool)
+        else:
+            instrumentation.count('segmentator.index')
+            box, region = found
         if close:
-            kernel = np.ones((11, 11), np.uint8)
-            s = cv2.morphologyEx(s, cv2.MORPH_CLOSE, kernel)
-        return np.array(s, dtype=bool)
+            region = self.close(region)
+        self.results[key] = (box, region)
+        if len(self.results) > self.cache_size:
+            self.results.popitem(last=False)
+        return box, region
+
+    def regionGrow(self, seed, close=True, progress=None, tolerance=10):
+        box, region = self.grow(seed, tolerance, close, progress)
+        mask = np.zeros(self.shape, dtype=bool)
+        mask[box] = region
+        return mask
+
+    def regionGrowMany(self, seeds, close=True, progress=None):
+        seeds = [s if len(s) == 2 else (s, 10) for s in seeds]
+        labels = np.zeros(self.shape, dtype=np.uint8 if len(seeds) < 256 else np.uint16)
+        for i, (seed, tolerance) in enumerate(seeds):
+            part = None if progress is None else lambda f, stage: progress((i + f) / len(seeds), stage)
+            box, region = self.grow(seed, tolerance, close, part)
+            # earlier seeds keep the voxels they already claimed
+            target = labels[box]
+            target[region & (target == 0)] = i + 1
+        return labels
 
 
 if __name__ == "__main__":
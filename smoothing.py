@@ -0,0 +1,92 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import scipy.ndimage as ndi
+
+from helper import accepts
+
+KERNELS = ('box', 'gaussian', 'median')
+MODES = ('3d', 'slice')
+
+
+def smoothing_tag(kernel='box', size=5, mode='slice', sigma=None):
+    tag = '%s%d-%s' % (kernel, size, mode)
+    return tag if sigma is None else tag + '-s%g' % sigma
+
+
+def chunks(length, slab):
+    return [slice(start, min(start + slab, length)) for start in range(0, length, slab)]
+
+
+def filter_axis(chunk, kernel, size, sigma, axis):
+    # 1D filters buffer each line, so writing back into the input is safe
+    if kernel == 'box':
+        ndi.uniform_filter1d(chunk, size, axis=axis, output=chunk, mode='nearest')
+    else:
+        ndi.gaussian_filter1d(chunk, sigma, axis=axis, output=chunk, mode='nearest',
+                              truncate=max(1.0, (size // 2) / sigma))
+
+
+def separable(volume, kernel, size, sigma, axes, pool, slab):
+    for axis in axes:
+        split = 1 if axis == 0 else 0
+        parts = []
+        for part in chunks(volume.shape[split], slab):
+            index = [slice(None)] * 3
+            index[split] = part
+            parts.append(volume[tuple(index)])
+        list(pool.map(lambda chunk: filter_axis(chunk, kernel, size, sigma, axis), parts))
+    return volume
+
+
+def median(volume, size, mode, pool, slab, out):
+    halo = size // 2 if mode == '3d' else 0
+    footprint = (size, size, size) if mode == '3d' else (1, size, size)
+
+    def run(part):
+        start, stop = max(0, part.start - halo), min(volume.shape[0], part.stop + halo)
+        result = ndi.median_filter(volume[start:stop], size=footprint, mode='nearest')
+        out[part] = result[part.start - start:part.stop - start]
+
+    list(pool.map(run, chunks(volume.shape[0], slab)))
+    return out
+
+
+def median_in_place(volume, size, mode, slab):
+    halo = size // 2 if mode == '3d' else 0
+    footprint = (size, size, size) if mode == '3d' else (1, size, size)
+    slab = max(slab, halo)
+    # slabs run in order, keeping the original rows just above the current slab for its halo
+    saved = volume[:0].copy()
+    for part in chunks(volume.shape[0], slab):
+        stop = min(volume.shape[0], part.stop + halo)
+        block = np.concatenate((saved, volume[part.start:stop]))
+        result = ndi.median_filter(block, size=footprint, mode='nearest')
+        offset = len(saved)
+        saved = volume[max(part.start, part.stop - halo):part.stop].copy()
+        volume[part] = result[offset:offset + part.stop - part.start]
+    return volume
+
+
+@accepts()
+def smooth(volume, kernel='box', size=5, mode='slice', sigma=None, workers=None, slab=16, out=None):
+    if kernel not in KERNELS:
+        raise ValueError('unknown smoothing kernel %r, expected one of %s' % (kernel, KERNELS))
+    if mode not in MODES:
+        raise ValueError('unknown smoothing mode %r, expected one of %s' % (mode, MODES))
+    if sigma is None:
+        sigma = max(size - 1, 1) / 4.0
+    with ThreadPoolExecutor(workers) as pool:
+        if kernel == 'median':
+            if out is volume:
+                return median_in_place(volume, size, mode, slab)
+            # not separable: slabs read a halo of the untouched input, so the output needs its own buffer
+            if out is None:
+                out = np.empty_like(volume)
+            return median(volume, size, mode, pool, slab, out)
+        if out is None:
+            out = volume
+        elif out is not volume:
+            out[...] = volume
+        axes = (0, 1, 2) if mode == '3d' else (1, 2)
+        return separable(out, kernel, size, sigma, axes, pool, slab)
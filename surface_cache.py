@@ -0,0 +1,46 @@
+from collections import OrderedDict
+
+import instrumentation
+
+
+class SurfaceCache:
+    def __init__(self, max_bytes=512 << 20):
+        self.max_bytes = max_bytes
+        self.surfaces = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.surfaces)
+
+    def get(self, key):
+        entry = self.surfaces.get(key)
+        if entry is None:
+            self.misses += 1
+            instrumentation.count('surface_cache.miss')
+            return None
+        self.surfaces.move_to_end(key)
+        self.hits += 1
+        instrumentation.count('surface_cache.hit')
+        return entry[0]
+
+    def put(self, key, surface):
+        # GetActualMemorySize reports kibibytes
+        size = surface.GetActualMemorySize() * 1024
+        self.discard(key)
+        if size > self.max_bytes:
+            return
+        self.surfaces[key] = (surface, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            self.discard(next(iter(self.surfaces)))
+
+    def discard(self, key):
+        entry = self.surfaces.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[1]
+
+    def clear(self):
+        self.surfaces.clear()
+        self.nbytes = 0
@@ -0,0 +1,34 @@
+import threading
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Task:
+    def __init__(self, callback=None, partial=None):
+        self.callback = callback
+        self.partial = partial
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def __call__(self, fraction, stage=''):
+        # every progress report doubles as a cancellation point
+        if self.cancelled.is_set():
+            raise Cancelled()
+        if self.callback is not None:
+            self.callback(float(fraction), stage)
+
+    def publish(self, value):
+        # hands an intermediate result to whoever waits for the task, e.g. a coarse volume
+        if self.cancelled.is_set():
+            raise Cancelled()
+        if self.partial is not None:
+            self.partial(value)
+
+
+def report(progress, fraction, stage=''):
+    if progress is not None:
+        progress(fraction, stage)
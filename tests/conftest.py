@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import synthetic_series  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def series(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp('series'))
+    synthetic_series(directory, slices=24, size=48)
+    return directory
@@ -0,0 +1,19 @@
+import numpy as np
+
+from budget import MemoryBudget
+from volume_cache import VolumeCache
+from volume_renderer import VolumeRenderer
+
+
+def test_budget_mesh_keeps_edits_on_cached_volume(series, tmp_path):
+    cache = VolumeCache(str(tmp_path))
+    VolumeRenderer(series, cache=cache)
+    verts = []
+    for budget in (None, MemoryBudget(factor=1.2)):
+        vr = VolumeRenderer(series, cache=cache, budget=budget)
+        assert isinstance(vr.layers.base, np.memmap)
+        vr.extract(600, 3000)
+        vr.make_mesh(200, tiled=True, slab=8)
+        verts.append(np.sort(vr.verts, axis=0))
+    assert verts[0].shape == verts[1].shape
+    assert np.allclose(verts[0], verts[1])
@@ -0,0 +1,17 @@
+import numpy as np
+
+import dicom_loader
+
+
+class Slice:
+    RescaleSlope = 1
+    RescaleIntercept = -1024
+    filename = None
+
+
+def test_integer_rescale_clips_to_int16(monkeypatch):
+    stored = np.array([[0, 1024, 40000, 65535]], dtype=np.uint16)
+    monkeypatch.setattr(dicom_loader.dicom, 'dcmread', lambda filename: type('D', (), {'pixel_array': stored}))
+    out = np.empty(stored.shape, dtype=np.int16)
+    dicom_loader.decode_slice(Slice(), out)
+    assert out.tolist() == [[-1024, 0, 32767, 32767]]
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+import volume_renderer
+from helper import blockwise_average_3D, build_pyramid
+from resampling import resample_volume
+from smoothing import smooth
+from volume_renderer import VolumeRenderer
+
+DTYPES = [np.int16, np.float32]
+
+
+def volume(dtype, shape=(12, 20, 20)):
+    return (np.random.default_rng(0).random(shape) * 2000 - 1000).astype(dtype)
+
+
+@pytest.fixture
+def renderer(series):
+    return VolumeRenderer(series, smoothing=None)
+
+
+@pytest.mark.parametrize('dtype', DTYPES)
+def test_downsampling_keeps_dtype(dtype):
+    assert blockwise_average_3D(volume(dtype), (2, 3, 2)).dtype == dtype
+    assert blockwise_average_3D(volume(dtype), (2, 2, 2), slab=4).dtype == dtype
+    assert all(level.dtype == dtype for level in build_pyramid(volume(dtype)).values())
+
+
+@pytest.mark.parametrize('dtype', DTYPES)
+def test_smoothing_keeps_dtype(dtype):
+    for kernel in ('box', 'gaussian', 'median'):
+        assert smooth(volume(dtype), kernel, 3, '3d').dtype == dtype
+    v = volume(dtype)
+    assert smooth(v, 'median', 3, 'slice', out=v).dtype == dtype
+
+
+@pytest.mark.parametrize('dtype', DTYPES)
+def test_resampling_keeps_dtype(dtype):
+    assert resample_volume(volume(dtype), (18, 10, 10)).dtype == dtype
+    assert resample_volume(volume(np.int16), (18, 10, 10), dtype=dtype).dtype == dtype
+
+
+@pytest.mark.parametrize('fn', [lambda v: blockwise_average_3D(v, (2, 2, 2)), build_pyramid,
+                                lambda v: smooth(v), lambda v: resample_volume(v, (6, 10, 10))])
+def test_float64_is_rejected(fn):
+    with pytest.raises(TypeError):
+        fn(volume(np.float64))
+
+
+def test_pixels_are_int16(renderer, monkeypatch):
+    assert renderer.get_pixels_hu(renderer.raw_scans).dtype == np.int16
+    monkeypatch.setattr(volume_renderer, 'read_volume', lambda *args, **kwargs: volume(np.float64))
+    with pytest.raises(TypeError):
+        renderer.get_pixels_hu(renderer.raw_scans)
+
+
+@pytest.mark.parametrize('dtype', DTYPES)
+def test_renderer_keeps_dtype(renderer, dtype):
+    vr = renderer
+    vr.scans = vr.scans.astype(dtype)
+    assert vr.scans.dtype == dtype
+    vr.build_pyramid()
+    assert vr.downsampled((2, 2, 2)).dtype == dtype
+    vr.smooth('box', 3)
+    assert vr.scans.dtype == dtype
+    assert vr.resample([2, 2, 2]).dtype == dtype
+    assert vr.resample([2, 2, 2], dtype=np.float32).dtype == np.float32
+    with pytest.raises(TypeError):
+        vr.resample([2, 2, 2], dtype=np.float64)
+    with pytest.raises(TypeError):
+        vr.scans = vr.scans.astype(np.float64)
@@ -0,0 +1,11 @@
+import numpy as np
+
+from mesh_io import quantize
+
+
+def test_quantize_uses_one_step_on_every_axis():
+    verts = np.random.default_rng(0).random((500, 3)) * [40.0, 90.0, 250.0] + [5.0, -3.0, 12.0]
+    q, lo, step = quantize(verts, 12)
+    assert np.all(step == step[0])
+    assert q.max() == 2 ** 12 - 1
+    assert np.abs(q * step + lo - verts).max() <= step[0] / 2 + 1e-9
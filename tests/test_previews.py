@@ -0,0 +1,17 @@
+import numpy as np
+
+from preview import render_previews
+from volume_cache import VolumeCache
+from volume_renderer import VolumeRenderer
+
+NAMES = ('axial', 'coronal')
+
+
+def test_previews_are_not_reused_after_smoothing(series, tmp_path):
+    vr = VolumeRenderer(series, cache=VolumeCache(str(tmp_path)))
+    before = vr.previews(NAMES, size=32, window=(-1000, 1000))
+    vr.smooth('gaussian', 15, '3d')
+    after = vr.previews(NAMES, size=32, window=(-1000, 1000))
+    fresh = render_previews(vr.scans, vr.spacing, -1000, 1000, 32, NAMES)
+    assert not all(np.array_equal(before[n], after[n]) for n in NAMES)
+    assert all(np.array_equal(fresh[n], after[n]) for n in NAMES)
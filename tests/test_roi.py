@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from volume_renderer import VolumeRenderer
+
+ROI = (slice(4, 20), slice(10, 40), slice(12, 36))
+SEED = [24, 24, 12]
+
+
+@pytest.fixture
+def renderer(series):
+    return VolumeRenderer(series, smoothing=None)
+
+
+def test_segmentation_returns_whole_volume_mask(renderer):
+    full = renderer.segmentation(SEED)
+    renderer.reset()
+    renderer.set_roi(ROI)
+    mask = renderer.segmentation(SEED)
+    assert mask.shape == renderer.layers.base.shape
+    assert not mask[:ROI[0].start].any()
+    assert np.array_equal(mask[ROI], full[ROI])
+    renderer.reset()
+    labels = renderer.segment_seeds([SEED])
+    assert labels.shape == renderer.layers.base.shape
+    assert np.array_equal(labels > 0, mask)
+
+
+def test_seed_outside_roi_is_rejected(renderer):
+    renderer.set_roi(ROI)
+    with pytest.raises(ValueError):
+        renderer.segmentation([0, 0, 0])
+
+
+def test_roi_mesh_is_in_whole_volume_coordinates(renderer):
+    renderer.make_mesh(600)
+    full = {tuple(v) for v in np.round(renderer.verts, 4)}
+    renderer.set_roi(ROI)
+    renderer.make_mesh(600)
+    lo = [r.start for r in ROI[::-1]]
+    assert np.all(renderer.verts.min(axis=0) >= lo)
+    inside = {tuple(v) for v in np.round(renderer.verts, 4)
+              if all(r.start < c < r.stop - 1 for c, r in zip(v, ROI[::-1]))}
+    assert inside and inside <= full
+
+
+def test_failed_seed_keeps_earlier_edits(renderer):
+    renderer.extract(-500, 3000)
+    renderer.set_roi(ROI)
+    with pytest.raises(ValueError):
+        renderer.segmentation([0, 0, 0], replace=True)
+    assert [layer.name for layer in renderer.layers.layers] == ['extract']
+    renderer.segmentation(SEED, replace=True)
+    assert [layer.name for layer in renderer.layers.layers] == ['segmentation']
@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from segmentator import Segmentator
+from volume_renderer import VolumeRenderer
+
+SEED = [24, 24, 12]
+AIR = [0, 0, 12]
+
+
+@pytest.fixture
+def renderer(series):
+    return VolumeRenderer(series, smoothing=None)
+
+
+def test_growing_respects_earlier_edits(renderer):
+    # with the body extracted away, air around it connects to where the body was
+    unedited = Segmentator(renderer.layers.base).regionGrow(AIR)
+    renderer.extract(-1000, 30)
+    edited = np.array(renderer.scans)
+    mask = renderer.segmentation(AIR)
+    assert np.array_equal(mask, Segmentator(edited).regionGrow(AIR))
+    assert mask.sum() > unedited.sum()
+
+
+def test_replacing_seed_grows_on_loaded_volume(renderer):
+    renderer.extract(600, 3000)
+    mask = renderer.segmentation(SEED, replace=True)
+    assert np.array_equal(mask, Segmentator(renderer.layers.base).regionGrow(SEED))
+    assert [layer.name for layer in renderer.layers.layers] == ['segmentation']
+
+
+def test_segmentator_imports_first():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = 'import segmentator, volume_renderer; volume_renderer.segmentator.Segmentator'
+    subprocess.run([sys.executable, '-c', code], cwd=root, check=True)
@@ -0,0 +1,24 @@
+import os
+
+import numpy as np
+
+from volume_cache import VolumeCache
+
+
+def test_store_evicts_least_recently_used(tmp_path):
+    series = []
+    for name in 'abc':
+        directory = tmp_path / name
+        directory.mkdir()
+        (directory / '1.dcm').write_bytes(b'x')
+        series.append(str(directory))
+    volume = np.zeros((4, 16, 16), dtype=np.int16)
+    cache = VolumeCache(str(tmp_path / 'cache'), max_bytes=2 * volume.nbytes)
+    cache.store(series[0], volume, (1, 1, 1))
+    cache.store(series[1], volume, (1, 1, 1))
+    os.utime(cache.paths(series[1], 'hu')[0], (0, 0))
+    assert cache.load(series[0]) is not None
+    cache.store(series[2], volume, (1, 1, 1))
+    assert cache.load(series[1]) is None
+    assert cache.load(series[0]) is not None
+    assert cache.load(series[2]) is not None
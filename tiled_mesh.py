@@ -0,0 +1,79 @@
+import mmap
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from skimage import measure
+
+from tasks import report
+
+
+def volume_source(volume, start, stop, edited=False):
+    # memory-mapped volumes are reopened by the workers instead of pickling the slab,
+    # unless copy-on-write edits mean the file no longer holds what the caller sees
+    if isinstance(volume, np.memmap) and isinstance(volume.base, mmap.mmap) and volume.filename:
+        if volume.mode != 'c' or not edited:
+            return volume.filename, volume.dtype.str, volume.shape, volume.offset
+    return np.ascontiguousarray(volume[start:stop])
+
+
+def read_slab(source, start, stop):
+    if isinstance(source, tuple):
+        filename, dtype, shape, offset = source
+        volume = np.memmap(filename, dtype=np.dtype(dtype), mode='r', shape=shape, offset=offset)
+        return np.array(volume[start:stop])
+    return source
+
+
+def mesh_slab(args):
+    source, start, stop, threshold, step_size = args
+    slab = read_slab(source, start, stop)
+    if slab.min() >= threshold or slab.max() <= threshold:
+        return (np.zeros((0, 3), np.float32), np.zeros((0, 3), np.int64),
+                np.zeros((0, 3), np.float32), np.zeros(0, np.float32))
+    verts, faces, norm, val = measure.marching_cubes(slab.transpose(2, 1, 0), threshold, step_size=step_size,
+                                                     allow_degenerate=True, method='lewiner')
+    verts[:, 2] += start
+    return verts, faces, norm, val
+
+
+def slab_ranges(depth, slab, step_size):
+    slab = max(step_size, slab - slab % step_size)
+    ranges = []
+    for start in range(0, depth, slab):
+        stop = min(start + slab + step_size, depth)
+        if stop - start > step_size:
+            ranges.append((start, stop))
+    return ranges
+
+
+def weld_seams(verts, faces, norm, val, seams):
+    idx = np.flatnonzero(np.isin(verts[:, 2], seams))
+    if len(idx) == 0:
+        return verts, faces, norm, val
+    _, first, inverse = np.unique(np.round(verts[idx], 4), axis=0, return_index=True, return_inverse=True)
+    remap = np.arange(len(verts))
+    remap[idx] = idx[first][inverse.reshape(-1)]
+    keep = remap == np.arange(len(verts))
+    index = np.cumsum(keep) - 1
+    return verts[keep], index[remap[faces]], norm[keep], val[keep]
+
+
+def marching_cubes_tiled(volume, threshold, step_size=1, slab=64, workers=None, progress=None, edited=False):
+    ranges = slab_ranges(volume.shape[0], slab, step_size)
+    tasks = [(volume_source(volume, start, stop, edited), start, stop, threshold, step_size) for start, stop in ranges]
+    pool = ProcessPoolExecutor(workers)
+    parts = []
+    try:
+        for part in pool.map(mesh_slab, tasks):
+            parts.append(part)
+            report(progress, len(parts) / len(tasks), 'surface')
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+    offsets = np.cumsum([0] + [len(p[0]) for p in parts])
+    verts = np.concatenate([p[0] for p in parts])
+    faces = np.concatenate([p[1].astype(np.int64) + offset for p, offset in zip(parts, offsets)])
+    norm = np.concatenate([p[2] for p in parts])
+    val = np.concatenate([p[3] for p in parts])
+    seams = [start for start, stop in ranges[1:]]
+    return weld_seams(verts, faces, norm, val, seams)
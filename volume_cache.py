@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from dicom_loader import list_series
+
+
+def default_cache_dir():
+    return os.environ.get('MEDAR_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'medar'))
+
+
+def default_cache_bytes():
+    return int(os.environ.get('MEDAR_CACHE_BYTES', 8 << 30))
+
+
+class VolumeCache:
+    def __init__(self, root=None, max_bytes=None):
+        self.root = default_cache_dir() if root is None else root
+        # None keeps everything; otherwise least recently used volumes go once the total passes it
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def next_to(cls, scans_dir):
+        return cls(os.path.abspath(scans_dir).rstrip(os.sep) + '.cache')
+
+    def key(self, scans_dir, tag):
+        path = os.path.abspath(scans_dir) + '|' + tag
+        return hashlib.sha1(path.encode('utf-8')).hexdigest()
+
+    def paths(self, scans_dir, tag):
+        base = os.path.join(self.root, self.key(scans_dir, tag))
+        return base + '.raw', base + '.json'
+
+    def fingerprint(self, scans_dir):
+        files = {}
+        for f in list_series(scans_dir):
+            st = os.stat(f)
+            files[os.path.basename(f)] = [st.st_mtime_ns, st.st_size]
+        return files
+
+    def load(self, scans_dir, tag='hu'):
+        raw, meta = self.paths(scans_dir, tag)
+        try:
+            with open(meta) as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if info.get('files') != self.fingerprint(scans_dir) or not os.path.exists(raw):
+            return None
+        # copy-on-write: in-place edits of the volume never reach the cache file
+        volume = np.memmap(raw, dtype=np.dtype(info['dtype']), mode='c', shape=tuple(info['shape']))
+        os.utime(raw)
+        return volume, info
+
+    def store(self, scans_dir, volume, spacing, tag='hu'):
+        os.makedirs(self.root, exist_ok=True)
+        raw, meta = self.paths(scans_dir, tag)
+        out = np.memmap(raw + '.tmp', dtype=volume.dtype, mode='w+', shape=volume.shape)
+        out[...] = volume
+        out.flush()
+        del out
+        os.replace(raw + '.tmp', raw)
+        info = {
+            'source': os.path.abspath(scans_dir),
+            'tag': tag,
+            'shape': list(volume.shape),
+            'dtype': volume.dtype.str,
+            'spacing': [float(s) for s in spacing],
+            'files': self.fingerprint(scans_dir),
+        }
+        with open(meta + '.tmp', 'w') as f:
+            json.dump(info, f)
+        os.replace(meta + '.tmp', meta)
+        self.evict(keep=raw)
+        return self.load(scans_dir, tag)
+
+    def entries(self):
+        entries = []
+        for name in os.listdir(self.root):
+            if name.endswith('.raw'):
+                path = os.path.join(self.root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        if self.max_bytes is None:
+            return []
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = []
+        # load() touches the raw file, so the oldest mtime is the least recently used volume;
+        # mapped volumes stay readable after their file is unlinked
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            for p in (path, path[:-len('.raw')] + '.json'):
+                if os.path.exists(p):
+                    os.remove(p)
+            total -= size
+            removed.append(path)
+        return removed
+
+    def invalidate(self, scans_dir, tag='hu'):
+        for path in self.paths(scans_dir, tag):
+            if os.path.exists(path):
+                os.remove(path)
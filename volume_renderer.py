@@ -1,27 +1,179 @@
 import pydicom as dicom
 import os
+from collections import OrderedDict
 
 import matplotlib.pyplot as plt
 import pydicom as dicom
-import scipy.ndimage
 import vtk
 from skimage import measure
-from stl import mesh as M
-from vtk.util import numpy_support
+from dicom_loader import read_headers, read_volume, read_volume_progressive
 from helper import *
-from segmentator import *
+from hu_stats import HUStatistics
+import instrumentation
+from layers import Layer, LayerStack
+from mesh_io import MESH_FORMATS, mesh_format, write_mesh
+from mesh_processing import simplify
+from preview import PREVIEWS, read_previews, render_previews, write_previews
+from tiled_mesh import marching_cubes_tiled
+from component_index import DEFAULT_BANDS
+import segmentator
+from resampling import resample_volume
+from smoothing import smooth, smoothing_tag
+from tasks import report
+from volume_cache import VolumeCache
+
+DEFAULT_SMOOTHING = {'kernel': 'box', 'size': 5, 'mode': 'slice'}
+
 
 class VolumeRenderer:
-    def __init__(self, scans_dir):
+    @instrumentation.traced('VolumeRenderer.load')
+    def __init__(self, scans_dir, workers=None, cache=None, progress=None, smoothing=DEFAULT_SMOOTHING,
+                 budget=None, refined=None, step=8):
         self.scans_dir = scans_dir
-        self.raw_scans = self.load_scans(scans_dir)[::-1]
-        self.scans = self.get_pixels_hu(self.raw_scans)
-        self.scans = cv2.blur(self.scans, (5, 5))
-        self.vtk_data = numpy_support.numpy_to_vtk(self.scans.ravel(), deep=True, array_type=vtk.VTK_FLOAT)
-
-    def load_scans(self, scans_dir):
-        slices = [dicom.read_file(scans_dir + '/' + s) for s in os.listdir(scans_dir)]
-        slices.sort(key=lambda x: int(x.InstanceNumber))
+        self.workers = workers
+        self.budget = budget
+        self.cache = cache
+        self.smoothing = smoothing
+        self.segmentator = None
+        self.roi = None
+        tag = 'hu' if smoothing is None else 'hu-' + smoothing_tag(**smoothing)
+        cached = None if cache is None else cache.load(scans_dir, tag)
+        if cache is not None:
+            instrumentation.count('volume_cache.hit' if cached is not None else 'volume_cache.miss')
+        if cached is not None:
+            self.scans, info = cached
+            self.spacing = np.array(info['spacing'])
+            self.raw_scans = None
+        else:
+            self.raw_scans = self.load_scans(scans_dir, progress)[::-1]
+            self.spacing = self.get_spacing(self.raw_scans)
+            if refined is None:
+                scans = self.get_pixels_hu(self.raw_scans, progress)
+            else:
+                # every Nth slice first, then refined in place: the callback sees the final buffer each time
+                scans = self.get_pixels_hu(self.raw_scans, progress,
+                                           lambda volume, fraction: refined(volume, self.spacing, fraction), step)
+            if smoothing is not None:
+                report(progress, 0, 'smoothing')
+                with instrumentation.stage('VolumeRenderer.smoothing', volume=scans, **smoothing):
+                    smooth(scans, workers=workers, slab=self.budget_slab(3, scans) or 16, out=scans, **smoothing)
+            self.scans = scans
+            if cache is not None:
+                with instrumentation.stage('VolumeCache.store', volume=scans):
+                    self.scans, info = cache.store(scans_dir, scans, self.spacing, tag)
+        # cleared by any later replacement of the volume (smooth, resample, downsampling)
+        self.pristine = True
+        self.build_pyramid()
+        self.statistics()
+        instrumentation.emit('volume', source=scans_dir, cached=cached is not None,
+                             spacing=self.spacing.tolist(), scans=self.scans)
+
+    @property
+    def scans(self):
+        return self.layers.volume()
+
+    @scans.setter
+    def scans(self, volume):
+        check_dtype(volume, stage='VolumeRenderer.scans')
+        if self.roi is not None and volume.shape != self.layers.base.shape:
+            # a resampled volume has other voxels, so the box has to be set again
+            self.roi = None
+        self.layers = LayerStack(volume, in_place=self.budget is not None)
+        self.stats = OrderedDict()
+        self.pristine = False
+
+    def set_roi(self, roi):
+        # (z, y, x) voxel slices; segmentation and meshing then work on a view of just that box
+        if roi is not None:
+            roi = tuple(slice(*r.indices(n)[:2]) for r, n in zip(roi, self.layers.base.shape))
+            if any(r.start >= r.stop for r in roi):
+                raise ValueError('empty region of interest %s' % (roi,))
+        self.roi = roi
+        instrumentation.emit('roi', roi=None if roi is None else [[r.start, r.stop] for r in roi])
+
+    def region(self, volume=None):
+        volume = self.scans if volume is None else volume
+        return volume if self.roi is None else volume[self.roi]
+
+    def roi_origin(self):
+        # in (x, y, z) order, like seeds and mesh vertices
+        return np.array([0, 0, 0] if self.roi is None else [r.start for r in self.roi[::-1]])
+
+    def whole(self, region):
+        # results on the roi box placed back into a whole-volume array, zero outside the box
+        if self.roi is None:
+            return region
+        result = np.zeros(self.layers.base.shape, dtype=region.dtype)
+        result[self.roi] = region
+        return result
+
+    def local_seed(self, seed):
+        local = np.asarray(seed) - self.roi_origin()
+        if (local < 0).any() or (local >= self.region(self.layers.base).shape[::-1]).any():
+            raise ValueError('seed %s lies outside the region of interest' % (list(seed),))
+        return [int(c) for c in local]
+
+    def budget_slab(self, bytes_per_voxel, volume=None, workers=1, minimum=1):
+        if self.budget is None:
+            return None
+        volume = self.scans if volume is None else volume
+        # the volume stays resident along with its pyramid, which adds less than a seventh
+        layers = self.layers.layers if hasattr(self, 'layers') else []
+        resident = volume.nbytes * 8 // 7 + sum(layer.nbytes for layer in layers)
+        return self.budget.slab(volume, bytes_per_voxel, resident, workers, minimum)
+
+    def statistics(self):
+        if () not in self.stats:
+            with instrumentation.stage('VolumeRenderer.statistics', volume=self.layers.base):
+                self.stats[()] = HUStatistics.from_volume(self.layers.base)
+        state = self.layers.state()
+        if state not in self.stats:
+            instrumentation.count('stats.update')
+            known = max(n for n in range(len(state)) if state[:n] in self.stats)
+            # only slices touched by the newer layers need recounting
+            touched = set()
+            for layer in self.layers.layers[known:]:
+                touched.update(layer.slices.tolist())
+            self.stats[state] = self.stats[state[:known]].updated(self.scans, sorted(touched))
+            while len(self.stats) > 8:
+                del self.stats[next(k for k in self.stats if k != ())]
+        return self.stats[state]
+
+    @instrumentation.traced()
+    def build_pyramid(self, levels=(2, 4, 8)):
+        self.pyramid = build_pyramid(self.scans, levels, self.budget_slab(4))
+        self.pyramid_version = self.layers.version
+        return self.pyramid
+
+    def downsampled(self, factor):
+        factor = tuple(factor)
+        if len(set(factor)) == 1:
+            if self.pyramid_version != self.layers.version:
+                self.build_pyramid(tuple(level for level in self.pyramid if level > 1))
+            if factor[0] in self.pyramid:
+                instrumentation.count('pyramid.hit')
+                return self.pyramid[factor[0]]
+        instrumentation.count('pyramid.miss')
+        return blockwise_average_3D(self.scans, factor, self.budget_slab(4))
+
+    @instrumentation.traced('VolumeRenderer.smooth')
+    def smooth(self, kernel='box', size=5, mode='slice', sigma=None):
+        self.scans = smooth(np.array(self.scans), kernel, size, mode, sigma, self.workers)
+        self.build_pyramid()
+        return self.scans
+
+    def undo(self):
+        return self.layers.undo()
+
+    def redo(self):
+        return self.layers.redo()
+
+    def reset(self):
+        return self.layers.reset()
+
+    @instrumentation.traced()
+    def load_scans(self, scans_dir, progress=None):
+        slices = read_headers(scans_dir, self.workers, progress)
         try:
             slice_thickness = np.abs(slices[0].ImagePositionPatient[2] - slices[1].ImagePositionPatient[2])
         except:
@@ -31,24 +183,27 @@ class VolumeRenderer:
             s.SliceThickness = slice_thickness
         return slices
 
-    def get_pixels_hu(self, scans):
-        image = np.stack([s.pixel_array for s in scans])
-        image = image.astype(np.int16)
-        intercept = -1000
-        slope = 1
-        if slope != 1:
-            image = slope * image.astype(np.float64)
-            image = image.astype(np.int16)
-        image += np.int16(intercept)
-        return np.array(image, dtype=np.int16)
+    def get_spacing(self, scans):
+        spacing = map(float, ([scans[0].SliceThickness] + list(scans[0].PixelSpacing)))
+        spacing = np.array(list(spacing))
+        if spacing[0] == 0.0:
+            spacing[0] = spacing[1] * 2
+        return spacing
+
+    @instrumentation.traced()
+    def get_pixels_hu(self, scans, progress=None, refined=None, step=8):
+        if refined is None:
+            volume = read_volume(scans, self.workers, progress=progress)
+        else:
+            volume = read_volume_progressive(scans, step, self.workers, progress=progress, refined=refined)
+        return check_dtype(volume, (VOLUME_DTYPE,), 'get_pixels_hu')
 
     def mask_scans(self, mask):
-        mask = np.array(mask, dtype=bool)
-        self.scans[~mask] = -1000
+        mask = np.asarray(mask, dtype=bool)
+        self.layers.push(Layer.from_mask(mask, name='mask'))
 
     def extract(self, alpha, beta):
-        self.scans[alpha > self.scans] = -1000
-        self.scans[beta < self.scans] = -1000
+        self.layers.push(Layer.from_predicate(self.scans, lambda s: (alpha <= s) & (s <= beta), name='extract'))
 
     def sample_view(self, rows=3, cols=3, start_with=0):
         fig, ax = plt.subplots(rows, cols, figsize=[12, 12])
@@ -61,60 +216,147 @@ class VolumeRenderer:
             ax[int(i / rows), int(i % rows)].axis('off')
         plt.show()
 
+    @instrumentation.traced()
+    def previews(self, names=PREVIEWS, size=256, window=None, factor=1, slab=32):
+        low, high = self.statistics().suggest_window() if window is None else window
+        volume = self.scans if factor == 1 else self.downsampled((factor,) * 3)
+        directory = None
+        if self.cache is not None and self.pristine and not self.layers.layers:
+            # only the unedited volume is worth keeping next to the cached scans
+            directory = os.path.join(self.cache.root, self.cache.key(self.scans_dir, 'previews') + '.previews')
+            info = {
+                'files': self.cache.fingerprint(self.scans_dir),
+                'smoothing': self.smoothing,
+                'shape': list(self.scans.shape),
+                'window': [int(low), int(high)],
+                'size': size,
+                'factor': factor,
+            }
+            images = read_previews(directory, names, info)
+            instrumentation.count('preview_cache.hit' if images is not None else 'preview_cache.miss')
+            if images is not None:
+                return images
+        images = render_previews(volume, self.spacing * factor, low, high, size, names, slab)
+        if directory is not None:
+            write_previews(directory, images, info)
+        return images
+
     def histogram(self):
-        plt.hist(self.scans.flatten(), bins=50, color='c')
+        stats = self.statistics()
+        plt.hist(stats.values, bins=50, weights=stats.total, color='c')
         plt.xlabel("Hounsfield Units (HU)")
         plt.ylabel("Frequency")
         plt.show()
 
-    def resample(self, new_spacing=[1, 1, 1]):
-        print("Start resampling")
-        # Determine current pixel spacing
-        spacing = map(float, ([self.raw_scans[0].SliceThickness] + list(self.raw_scans[0].PixelSpacing)))
-        spacing = np.array(list(spacing))
-        if spacing[0] == 0.0:
-            spacing[0] = spacing[1] * 2
+    @instrumentation.traced()
+    def resample(self, new_spacing=[1, 1, 1], order=1, dtype=None, out=None):
+        if dtype is not None and np.dtype(dtype) not in VOLUME_DTYPES:
+            raise TypeError('resample keeps volumes in %s, got %s' % ('/'.join(str(d) for d in VOLUME_DTYPES), dtype))
+        spacing = self.spacing
         resize_factor = spacing / new_spacing
         new_real_shape = self.scans.shape * resize_factor
         new_shape = np.round(new_real_shape)
         real_resize_factor = new_shape / self.scans.shape
         new_spacing = spacing / real_resize_factor
 
-        self.scans = scipy.ndimage.interpolation.zoom(self.scans, real_resize_factor)
-        print(new_spacing) #
+        self.scans = resample_volume(self.scans, new_shape, order, dtype, out, self.workers)
+        self.spacing = new_spacing
+        self.build_pyramid()
+        instrumentation.emit('spacing', spacing=new_spacing.tolist())
+        return self.scans
+
+    def make_mesh(self, threshold=600, step_size=1, tiled=False, slab=64, workers=None, progress=None):
+        volume = self.region()
+        check_dtype(volume, stage='VolumeRenderer.make_mesh')
+        if self.budget is not None:
+            # marching cubes works on a float copy of its input, so only slabs of it fit the budget
+            workers = workers or self.workers or os.cpu_count()
+            tiled = True
+            slab = self.budget_slab(16, workers=workers, minimum=2 * step_size + 1)
+        with instrumentation.stage('VolumeRenderer.make_mesh', threshold=threshold, step_size=step_size,
+                                   tiled=tiled, scans=volume) as fields:
+            if tiled:
+                # in-place layers live only in this process's copy-on-write pages of a cached volume
+                edited = self.layers.in_place and bool(self.layers.layers)
+                self.verts, self.faces, self.norm, self.val = marching_cubes_tiled(volume, threshold, step_size,
+                                                                                   slab, workers or self.workers, progress,
+                                                                                   edited)
+            else:
+                report(progress, 0, 'surface')
+                p = volume.transpose(2, 1, 0)
+                self.verts, self.faces, self.norm, self.val = measure.marching_cubes(p, threshold, step_size=step_size,
+                                                                                     allow_degenerate=True,
+                                                                                     method='lewiner')
+                report(progress, 1, 'surface')
+            if self.roi is not None:
+                self.verts += self.roi_origin()
+            fields.update(verts=self.verts, faces=self.faces)
 
-    def make_mesh(self, threshold=600, step_size=1):
-        print("Transposing surface")
-        p = self.scans.transpose(2, 1, 0)
-        print("Calculating surface")
-        self.verts, self.faces, self.norm, self.val = measure.marching_cubes_lewiner(p, threshold, step_size=step_size,
-                                                                 allow_degenerate=True)
+    def simplify_mesh(self, target_faces=None, max_error=None, smoothing=0, tolerance=1e-6):
+        with instrumentation.stage('VolumeRenderer.simplify_mesh', target_faces=target_faces,
+                                   max_error=max_error, smoothing=smoothing) as fields:
+            self.verts, self.faces, stats = simplify(self.verts, self.faces, target_faces, max_error,
+                                                     smoothing, tolerance)
+            fields.update(stats)
+        # per-vertex outputs of marching cubes no longer line up with the vertices
+        self.norm = self.val = None
+        return stats
 
     def scale(self, size):
         if self.verts is None:
             self.make_mesh()
         matrix = scale_matrix(size)
         self.verts = transform(self.verts, matrix)
+        if self.norm is not None:
+            self.norm = transform_normals(self.norm, matrix).astype(np.float32)
 
-    def save(self, filename='model'):
-        model = M.Mesh(np.zeros(self.faces.shape[0], dtype=M.Mesh.dtype))
-        for i, f in enumerate(self.faces):
-            for j in range(3):
-                model.vectors[i][j] = self.verts[f[j], :]
-        model.save('data/' + filename + '.stl')
+    @instrumentation.traced()
+    def save(self, filename='model', path=None, chunk_size=1 << 18, progress=None, bits=None):
+        # the format follows the extension (.stl, .ply, .glb, optionally .gz), STL by default
+        if path is None:
+            path = 'data/' + filename + ('' if mesh_format(filename) in MESH_FORMATS else '.stl')
+        return write_mesh(path, self.verts, self.faces, self.norm, bits, chunk_size, progress)
 
 
-    def segmentation(self, seed):
-        segmentator = Segmentator(self.scans)
-        mask = segmentator.regionGrow(seed)
-        self.scans[~mask] = -1000
+    def get_segmentator(self, edited=True):
+        # regions grow through the current edits, as on the edited scans; edited=False grows on the
+        # loaded volume instead, whose prepared image then survives any number of edits
+        state = self.layers.state() if edited else ()
+        if (self.segmentator is None or self.segmentator.source is not self.layers.base
+                or self.segmentator.state != state or self.segmentator.roi != self.roi):
+            instrumentation.count('segmentator.prepare')
+            self.segmentator = segmentator.Segmentator(self.region(self.scans if state else self.layers.base))
+            self.segmentator.source = self.layers.base
+            self.segmentator.state = state
+            self.segmentator.roi = self.roi
+        return self.segmentator
+
+    def index_components(self, bands=DEFAULT_BANDS, workers=None):
+        return self.get_segmentator().indexComponents(bands, workers or self.workers)
+
+    @instrumentation.traced()
+    def segmentation(self, seed, progress=None, tolerance=10, replace=False):
+        # a replacing seed ignores the edits it is about to reset
+        mask = self.whole(self.get_segmentator(edited=not replace).regionGrow(self.local_seed(seed), progress=progress,
+                                                                              tolerance=tolerance))
+        if replace:
+            # earlier edits go only once the region has grown, so a cancel or a bad seed leaves them alone
+            self.layers.reset()
+        self.layers.push(Layer.from_mask(mask, name='segmentation'))
         return mask
 
+    @instrumentation.traced()
+    def segment_seeds(self, seeds, progress=None):
+        seeds = [(self.local_seed(s), t) for s, t in (s if len(s) == 2 else (s, 10) for s in seeds)]
+        labels = self.whole(self.get_segmentator().regionGrowMany(seeds, progress=progress))
+        self.layers.push(Layer.from_slices(labels.shape, (s > 0 for s in labels), name='segmentation'))
+        return labels
+
 
 if __name__ == "__main__":
 
     vr = VolumeRenderer('data/lung1')
-    scale = list(vr.raw_scans[0].PixelSpacing) + [vr.raw_scans[0].SliceThickness]
+    scale = list(vr.spacing[::-1])
     vr.scans = blockwise_average_3D(vr.scans[:128], (2, 2, 2))
 
 
@@ -0,0 +1,40 @@
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+
+class VolumeImport:
+    def __init__(self, reader=None):
+        self.reader = vtk.vtkImageImport() if reader is None else reader
+        self.array = None
+        self.data = None
+        self.geometry = None
+
+    def GetOutputPort(self):
+        return self.reader.GetOutputPort()
+
+    def set_volume(self, array, spacing=(1, 1, 1), origin=(0, 0, 0)):
+        geometry = (tuple(float(s) for s in spacing), tuple(float(o) for o in origin))
+        if array is self.array and geometry == self.geometry:
+            return False
+        # VTK reads straight from the NumPy buffer; only non-contiguous input is copied
+        data = np.ascontiguousarray(array)
+        if data.dtype == np.bool_:
+            data = data.view(np.uint8)
+        [h, w, z] = data.shape
+        self.reader.SetImportVoidPointer(data, 1)
+        self.reader.SetDataScalarType(numpy_support.get_vtk_array_type(data.dtype))
+        self.reader.SetNumberOfScalarComponents(1)
+        self.reader.SetDataExtent(0, z - 1, 0, w - 1, 0, h - 1)
+        self.reader.SetWholeExtent(0, z - 1, 0, w - 1, 0, h - 1)
+        self.reader.SetDataSpacing(*geometry[0])
+        self.reader.SetDataOrigin(*geometry[1])
+        self.reader.Modified()
+        # the reader does not own the buffer, so keep both objects alive with it
+        self.array = array
+        self.data = data
+        self.geometry = geometry
+        return True
+
+    def refresh(self):
+        self.reader.Modified()